@@ -3,35 +3,62 @@
 FastAPI 應用主程式，提供檔案上傳、聊天功能及 Line Bot 服務。
 """
 
+import json
 import shutil
 import uuid
 import logging
 import asyncio
-from typing import Dict
+import threading
+from typing import AsyncIterator, Dict, List, Optional
+from functools import partial
 from pathlib import Path
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, File, UploadFile, Request, Header, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, File, UploadFile, Request, Header, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
 from utils.llm_utils import llm_invoke
-from utils.ocr_utils import generate_pdf_thumbnails, get_existing_thumbnails, docling_extract_text_from_file, extract_text_from_file
+from utils.ocr_utils import (
+    OCR_LANGUAGE_AUTO,
+    OCR_THREADS,
+    ocr_language_stats,
+    generate_pdf_thumbnails,
+    get_existing_thumbnails,
+    get_thumbnail_progress,
+    get_text_progress,
+    thumbnail_url,
+    docling_extract_text_from_file,
+    extract_text_from_file,
+    is_text_extracted,
+    get_page_count,
+    is_valid_ocr_language,
+    estimate_ocr_memory,
+)
+from utils.artifact_store import artifact_pack_path, open_artifact_pack
 from utils.line_bot_handler import handle_line_ask_message, handle_line_assistant_message
-from utils.redis_utils import init_redis_pool, close_redis_pool
-
-logging.basicConfig(level=logging.INFO)
+from utils.singleflight import SingleFlight
+from utils.job_scheduler import IngestScheduler, JobCancelledError, PRIORITY_BATCH, PRIORITY_INTERACTIVE
+from utils.logging_utils import setup_logging, shutdown_logging
+from utils.redis_utils import init_redis_pool, close_redis_pool, update_redis_history_chat
+from utils.memory_utils import remember_turn
+from utils.summary_utils import build_document_context, get_cached_summary, is_overview_question, schedule_document_summary
+
+# 於啟動時設定一次佇列式日誌
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # 生命週期事件處理器
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # 啟動事件
+    # 啟動事件（setup_logging 可重複呼叫；前一次 lifespan 關閉後於此重新啟用佇列式日誌）
+    setup_logging()
     await init_redis_pool()
     yield
     # 關閉事件
     await close_redis_pool()
+    shutdown_logging()
 
 # 初始化 FastAPI 應用，使用 lifespan
 app = FastAPI(title="Chat and File Management API", lifespan=lifespan)
@@ -54,6 +81,21 @@ app.mount("/output", StaticFiles(directory=OUTPUT_FOLDER), name="output")
 
 # 全域變數追蹤 RAG 處理狀態
 rag_status: Dict[str, bool] = {}
+# 最近一次 RAG 處理失敗或取消的原因；保留至下次提交，讓較晚連線的 WebSocket 仍能收到結果
+rag_errors: Dict[str, str] = {}
+
+# 全域 RAG 處理排程器
+ingest_scheduler = IngestScheduler()
+
+# 合併相同檔案的並行縮圖與 RAG 處理（跨 worker 透過 Redis 鎖）
+single_flight = SingleFlight()
+THUMBNAIL_LOCK_TTL = 60
+# 此程序中進行中縮圖渲染的取消事件，移除檔案時用來停止渲染執行緒
+thumbnail_cancel_events: Dict[str, threading.Event] = {}
+THUMBNAIL_POLL_INTERVAL = 0.3
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+RAG_LOCK_TTL = 120
+RAG_RESULT_TTL = 60
 
 # WebSocket 連線管理
 class ConnectionManager:
@@ -68,9 +110,19 @@ class ConnectionManager:
         if filename in self.active_connections:
             del self.active_connections[filename]
 
-    async def send_status(self, filename: str, is_complete: bool):
+    async def send_status(
+        self,
+        filename: str,
+        is_complete: bool,
+        pages_done: Optional[int] = None,
+        page_count: Optional[int] = None,
+        error: Optional[str] = None,
+    ):
         if filename in self.active_connections:
-            await self.active_connections[filename].send_json({"filename": filename, "is_complete": is_complete})
+            status = {"filename": filename, "is_complete": is_complete, "pages_done": pages_done, "page_count": page_count}
+            if error:
+                status["error"] = error
+            await self.active_connections[filename].send_json(status)
 
 manager = ConnectionManager()
 
@@ -92,6 +144,10 @@ async def read_index(request: Request) -> HTMLResponse:
 async def submit_chat(request: Request) -> JSONResponse:
     """處理聊天提交並返回 AI 回應。
 
+    若表單包含 filename，則以該文件的預先摘要或內容作為參考資料；
+    詢問文件整體內容時直接返回快取的文件摘要。文件仍在處理中時，
+    以已完成的頁面回答並註明涵蓋範圍。
+
     Args:
         request (Request): FastAPI 請求對象，包含表單數據。
 
@@ -101,9 +157,30 @@ async def submit_chat(request: Request) -> JSONResponse:
     form_data = await request.form()
     text = form_data.get('text')
     chat_id = form_data.get('chat_id', str(uuid.uuid4()))
-    logging.info(f"聊天提交: {text}, chat_id: {chat_id}")
-    response = await llm_invoke('web-chat', chat_id, text)
-    logging.info(f"聊天回應完成: {response}")
+    filename = form_data.get('filename')
+    logger.info("聊天提交", extra={"chat_id": chat_id, "document": filename, "question_chars": len(text or "")})
+
+    context = None
+    coverage = None
+    if filename:
+        base_filename = Path(filename).stem
+        output_subfolder = str(OUTPUT_FOLDER / base_filename)
+        if is_overview_question(text):
+            summary = await asyncio.to_thread(get_cached_summary, output_subfolder, base_filename)
+            if summary is not None:
+                response = summary["document_summary"]
+                await remember_turn(chat_id, text, response)
+                await update_redis_history_chat(chat_id, text, response)
+                logger.info("聊天回應完成（文件摘要快取）", extra={"chat_id": chat_id})
+                return JSONResponse(content={"result": f"AI回答:\n{response}", "chat_id": chat_id})
+        # 讀取與解壓頁面文字在執行緒中進行，避免阻塞事件迴圈
+        context, coverage = await asyncio.to_thread(build_document_context, output_subfolder, base_filename, text)
+
+    response = await llm_invoke('web-chat', chat_id, text, context=context)
+    logger.info("聊天回應完成", extra={"chat_id": chat_id, "response_chars": len(response)})
+    if coverage:
+        # 文件仍在處理中，註明回答所依據的頁面範圍
+        response = f"{response}\n\n{coverage}"
     return JSONResponse(content={"result": f"AI回答:\n{response}", "chat_id": chat_id})
 
 # 檔案上傳路由
@@ -118,13 +195,19 @@ async def upload_file(file: UploadFile = File(...)) -> JSONResponse:
         JSONResponse: 上傳成功的訊息與檔案名稱。
     """
     file_path = UPLOAD_FOLDER / file.filename
-    with file_path.open("wb") as file_handle:
-        file_handle.write(await file.read())
-    
+    content = await file.read()
     base_filename = Path(file.filename).stem
     output_subfolder = OUTPUT_FOLDER / base_filename
-    txt_exists = (output_subfolder / f"{base_filename}_full_text.txt").exists()
-    is_rag_processed = txt_exists
+
+    # 同名檔案內容變更時，舊的頁面文字、縮圖與摘要都已過期
+    if file_path.exists() and await asyncio.to_thread(file_path.read_bytes) != content:
+        await discard_document_outputs(file.filename)
+        logging.info(f"上傳內容已變更，已清除舊的處理結果: {file.filename}")
+
+    with file_path.open("wb") as file_handle:
+        file_handle.write(content)
+    
+    is_rag_processed = is_text_extracted(file.filename, str(output_subfolder))
     
     return JSONResponse(content={
         "message": "File uploaded successfully",
@@ -132,6 +215,19 @@ async def upload_file(file: UploadFile = File(...)) -> JSONResponse:
         "is_rag_processed": is_rag_processed
     })
 
+async def discard_document_outputs(filename: str) -> None:
+    """停止檔案的處理工作與縮圖渲染，待其執行緒結束後刪除輸出子目錄（封裝檔、摘要與 Docling 輸出）與處理狀態。"""
+    if await ingest_scheduler.cancel(filename):
+        logging.info(f"已取消檔案的處理工作: {filename}")
+    await cancel_thumbnails(filename)
+    rag_status.pop(filename, None)
+    rag_errors.pop(filename, None)
+
+    output_subfolder = OUTPUT_FOLDER / Path(filename).stem
+    if output_subfolder.exists() and output_subfolder.is_dir():
+        await asyncio.to_thread(shutil.rmtree, output_subfolder)
+        logging.info(f"已移除輸出子目錄: {output_subfolder}")
+
 # 移除檔案路由
 @app.post("/remove")
 async def remove_file(request: Request) -> JSONResponse:
@@ -147,16 +243,13 @@ async def remove_file(request: Request) -> JSONResponse:
     filename = form_data.get('filename')
     file_path = UPLOAD_FOLDER / filename
 
+    # 先停止該檔案的處理工作與縮圖渲染，並等待其結束，避免刪除後又寫回封裝檔
+    await discard_document_outputs(filename)
+
     if file_path.exists():
         file_path.unlink()
     else:
         logging.warning(f"移除時檔案不存在: {file_path}")
-
-    base_filename = Path(filename).stem
-    output_subfolder = OUTPUT_FOLDER / base_filename
-    if output_subfolder.exists() and output_subfolder.is_dir():
-        shutil.rmtree(output_subfolder)
-        logging.info(f"已移除輸出子目錄: {output_subfolder}")
     
     return JSONResponse(content={"message": "檔案及其相關輸出已移除"})
 
@@ -174,11 +267,13 @@ async def get_uploaded_files() -> JSONResponse:
             if f.is_file():
                 base_filename = f.stem
                 output_subfolder = OUTPUT_FOLDER / base_filename
-                txt_exists = (output_subfolder / f"{base_filename}_full_text.txt").exists()
-                is_rag_processed = txt_exists
+                is_rag_processed = is_text_extracted(f.name, str(output_subfolder))
+                pages_done, page_count = get_text_progress(f.name, str(output_subfolder))
                 files.append({
                     "filename": f.name,
-                    "is_rag_processed": is_rag_processed
+                    "is_rag_processed": is_rag_processed,
+                    "pages_done": pages_done,
+                    "page_count": page_count
                 })
         return JSONResponse(content={"files": files})
     except Exception as error:
@@ -186,14 +281,17 @@ async def get_uploaded_files() -> JSONResponse:
 
 # 截圖處理路由
 @app.post("/screenshot")
-async def screenshot_files(request: Request) -> JSONResponse:
+async def screenshot_files(request: Request) -> Response:
     """處理檔案截圖，支援 PDF 和其他格式。
 
+    以 NDJSON 串流回傳縮圖路徑（每行一個 {"thumbnail": ...}）。PDF 縮圖於執行緒中渲染，
+    首頁完成即開始回傳，其餘頁面隨渲染進度陸續送出。
+
     Args:
         request (Request): FastAPI 請求對象，包含表單數據。
 
     Returns:
-        JSONResponse: 包含截圖路徑或錯誤訊息的 JSON 響應。
+        Response: 縮圖路徑的 NDJSON 串流，或錯誤訊息的 JSON 響應。
     """
     form_data = await request.form()
     filename = form_data.get('file_path')
@@ -211,17 +309,99 @@ async def screenshot_files(request: Request) -> JSONResponse:
     base_filename = Path(filename).stem
     output_subfolder = OUTPUT_FOLDER / base_filename
 
-    if file_path.suffix.lower() == '.pdf':
-        existing_thumbnails = get_existing_thumbnails(filename, str(output_subfolder))
-        if existing_thumbnails:
-            return JSONResponse(content={"thumbnails": existing_thumbnails})
-        thumbnail_paths = generate_pdf_thumbnails(str(file_path), str(output_subfolder))
-        return JSONResponse(content={"thumbnails": thumbnail_paths})
-    return JSONResponse(content={"thumbnails": [f"/uploads/{filename}"]})
+    if file_path.suffix.lower() != '.pdf':
+        return StreamingResponse(iter([json.dumps({"thumbnail": f"/uploads/{filename}"}) + "\n"]), media_type=NDJSON_MEDIA_TYPE)
+
+    render_task = None
+    if not get_existing_thumbnails(filename, str(output_subfolder)):
+        # 多個分頁同時請求同一檔案時只產生一次縮圖
+        render_task = asyncio.ensure_future(render_thumbnails(filename, str(output_subfolder)))
+        # 用戶端中途斷線時仍取得例外，避免未處理例外的警告
+        render_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+    return StreamingResponse(
+        stream_thumbnails(filename, str(output_subfolder), render_task),
+        media_type=NDJSON_MEDIA_TYPE,
+    )
+
+async def render_thumbnails(filename: str, output_folder: str) -> List[str]:
+    """產生 PDF 縮圖；/screenshot 與 RAG 處理共用同一 single-flight key，同一檔案只渲染一次。"""
+    async def render() -> List[str]:
+        cancel_event = threading.Event()
+        thumbnail_cancel_events[filename] = cancel_event
+        try:
+            return await asyncio.to_thread(
+                generate_pdf_thumbnails, str(UPLOAD_FOLDER / filename), output_folder, cancel_event=cancel_event
+            )
+        finally:
+            if thumbnail_cancel_events.get(filename) is cancel_event:
+                del thumbnail_cancel_events[filename]
+
+    return await single_flight.do(
+        f"thumbnails:{filename}",
+        render,
+        distributed=True,
+        lock_ttl=THUMBNAIL_LOCK_TTL,
+    )
+
+async def cancel_thumbnails(filename: str) -> None:
+    """停止此程序中該檔案進行中的縮圖渲染，並等待渲染執行緒結束。"""
+    cancel_event = thumbnail_cancel_events.get(filename)
+    if cancel_event is None:
+        return
+    cancel_event.set()
+    await single_flight.wait(f"thumbnails:{filename}")
+    logging.info(f"已停止檔案的縮圖渲染: {filename}")
+
+async def stream_thumbnails(filename: str, output_folder: str, render_task: Optional[asyncio.Future]) -> AsyncIterator[str]:
+    """隨渲染進度逐行輸出已寫入封裝檔的縮圖路徑，直到渲染結束。"""
+    base_filename = Path(filename).stem
+    sent = 0
+    while True:
+        finished = render_task is None or render_task.done()
+        available, page_count = get_thumbnail_progress(filename, output_folder)
+        for page in range(sent + 1, available + 1):
+            yield json.dumps({"thumbnail": thumbnail_url(base_filename, page), "page": page, "page_count": page_count}) + "\n"
+        sent = max(sent, available)
+        if finished:
+            break
+        await asyncio.sleep(THUMBNAIL_POLL_INTERVAL)
+
+    if render_task is not None and not render_task.cancelled() and render_task.exception() is not None:
+        logging.error(f"縮圖產生失敗: {render_task.exception()}")
+        yield json.dumps({"error": str(render_task.exception())}) + "\n"
+
+# 縮圖讀取路由
+@app.get("/thumbnail/{base_filename}/{page}")
+async def get_thumbnail(base_filename: str, page: int) -> Response:
+    """從文件產物封裝檔讀取指定頁的 PNG 縮圖。
+
+    Args:
+        base_filename (str): 檔案名稱（不含副檔名）。
+        page (int): 頁碼（從 1 開始）。
+
+    Returns:
+        Response: PNG 圖片，若不存在則返回 404。
+    """
+    if Path(base_filename).name != base_filename:
+        raise HTTPException(status_code=400, detail="無效的檔案名稱")
+    pack = open_artifact_pack(artifact_pack_path(str(OUTPUT_FOLDER / base_filename), base_filename))
+    thumbnail = pack.read_thumbnail(page) if pack is not None else None
+    if thumbnail is None:
+        raise HTTPException(status_code=404, detail="縮圖不存在")
+    return Response(content=thumbnail, media_type="image/png")
 
 # RAG 處理路由
 @app.post("/rag")
-async def rag_files(request: Request, background_tasks: BackgroundTasks) -> JSONResponse:
+async def rag_files(request: Request) -> JSONResponse:
+    """提交單一檔案的 RAG 處理工作（互動優先權）。
+
+    Args:
+        request (Request): FastAPI 請求對象，包含 JSON {"filename": ..., "lang": ...}；
+            lang 可指定 Tesseract 語言組（例如 "eng"），省略時逐頁自動偵測。
+
+    Returns:
+        JSONResponse: 工作已提交的訊息。
+    """
     data = await request.json()
     filename = data.get("filename")
     if not filename:
@@ -229,15 +409,16 @@ async def rag_files(request: Request, background_tasks: BackgroundTasks) -> JSON
         return JSONResponse({"error": "未提供文件名"}, status_code=400)
     
     file_location = UPLOAD_FOLDER / filename
-    base_filename = Path(filename).stem
-    output_subfolder = OUTPUT_FOLDER / base_filename
-    
     if not file_location.exists():
         logging.error(f"檔案不存在: {file_location}")
         return JSONResponse({"error": f"檔案不存在: {file_location}"}, status_code=404)
     
-    rag_status[filename] = False
-    background_tasks.add_task(process_rag_with_thumbnails, file_location, output_subfolder, filename)
+    lang = data.get("lang") or OCR_LANGUAGE_AUTO
+    if not is_valid_ocr_language(lang):
+        logging.error(f"不支援的 OCR 語言組: {lang}")
+        return JSONResponse({"error": f"不支援的 OCR 語言組: {lang}"}, status_code=400)
+
+    submit_rag_job(filename, PRIORITY_INTERACTIVE, lang)
     
     logging.info(f"RAG 處理已啟動: {file_location}")
     return JSONResponse({
@@ -245,33 +426,143 @@ async def rag_files(request: Request, background_tasks: BackgroundTasks) -> JSON
         "thumbnails": []
     })
 
-async def process_rag_with_thumbnails(file_location: str, output_folder: str, filename: str):
-    try:
-        thumbnails = []
-        if Path(file_location).suffix.lower() == '.pdf':
-            existing_thumbnails = get_existing_thumbnails(filename, output_folder)
-            if existing_thumbnails:
-                thumbnails = existing_thumbnails
-            else:
-                thumbnails = generate_pdf_thumbnails(file_location, output_folder)
+# 批次 RAG 處理路由
+@app.post("/rag-batch")
+async def rag_batch_files(request: Request) -> JSONResponse:
+    """以批次優先權提交多個檔案的 RAG 處理工作。
+
+    Args:
+        request (Request): FastAPI 請求對象，包含 JSON {"filenames": [...], "lang": ...}。
+
+    Returns:
+        JSONResponse: 已提交與不存在的檔案列表。
+    """
+    data = await request.json()
+    filenames = data.get("filenames") or []
+    if not filenames:
+        logging.error("未提供文件名")
+        return JSONResponse({"error": "未提供文件名"}, status_code=400)
+
+    lang = data.get("lang") or OCR_LANGUAGE_AUTO
+    if not is_valid_ocr_language(lang):
+        logging.error(f"不支援的 OCR 語言組: {lang}")
+        return JSONResponse({"error": f"不支援的 OCR 語言組: {lang}"}, status_code=400)
+
+    submitted, missing = [], []
+    for filename in filenames:
+        if (UPLOAD_FOLDER / filename).exists():
+            submit_rag_job(filename, PRIORITY_BATCH, lang)
+            submitted.append(filename)
         else:
-            thumbnails = [f"/uploads/{filename}"]
-        logging.info(f"截圖生成完成: {thumbnails}")
-
-        #result = docling_extract_text_from_file(file_location, output_folder)
-        result = extract_text_from_file(file_location, output_folder)
-        if isinstance(result, list) and len(result) > 0 and result[0].startswith("錯誤:"):
-            logging.error(f"RAG 處理失敗: {result[0]}")
-            await manager.send_status(filename, False)  # 通知前端失敗
-            return
-        # 正常情況，result 是一個文字列表，處理成功
-        logging.info(f"RAG 處理完成: {file_location}")
+            missing.append(filename)
+
+    logging.info(f"批次 RAG 處理已提交: {submitted}")
+    return JSONResponse({"message": "批次 RAG 處理已提交", "submitted": submitted, "missing": missing})
+
+# 取消 RAG 處理路由
+@app.post("/rag-cancel")
+async def rag_cancel(request: Request) -> JSONResponse:
+    """取消排隊中或執行中的 RAG 處理工作。
+
+    Args:
+        request (Request): FastAPI 請求對象，包含 JSON {"filename": ...}。
+
+    Returns:
+        JSONResponse: 是否有工作被取消。
+    """
+    data = await request.json()
+    filename = data.get("filename")
+    if not filename:
+        return JSONResponse({"error": "未提供文件名"}, status_code=400)
+    cancelled = await ingest_scheduler.cancel(filename)
+    return JSONResponse({"filename": filename, "cancelled": cancelled})
+
+# 排程狀態路由
+@app.get("/rag-queue")
+async def rag_queue() -> JSONResponse:
+    """回傳 RAG 處理排程器的資源使用與佇列狀態。"""
+    return JSONResponse(ingest_scheduler.status())
+
+# OCR 語言統計路由
+@app.get("/ocr-stats")
+async def ocr_stats() -> JSONResponse:
+    """回傳各 OCR 語言組的選用頁數、平均耗時與估計節省的時間。"""
+    return JSONResponse(ocr_language_stats.snapshot())
+
+def submit_rag_job(filename: str, priority: int, lang: str = OCR_LANGUAGE_AUTO) -> None:
+    """提交檔案的 RAG 處理，並在背景等待結果。
+
+    同一檔案已在處理中時不重複提交，僅可能提升其優先權。
+    """
+    rag_status[filename] = False
+    rag_errors.pop(filename, None)
+    if single_flight.in_flight(f"rag:{filename}"):
+        ingest_scheduler.promote(filename, priority)
+        return
+    asyncio.create_task(wait_rag_job(filename, priority, lang))
+
+async def run_rag_job(filename: str, priority: int, lang: str) -> int:
+    """將檔案的 OCR 處理提交至排程器並等待完成，返回提取的頁數。
+
+    PDF 縮圖於事件迴圈上另行渲染（與 /screenshot 的同時請求合併），與 OCR 並行，不延後 OCR 開始。
+    """
+    file_location = str(UPLOAD_FOLDER / filename)
+    output_subfolder = str(OUTPUT_FOLDER / Path(filename).stem)
+    if Path(filename).suffix.lower() == '.pdf' and not get_existing_thumbnails(filename, output_subfolder):
+        render_task = asyncio.ensure_future(render_thumbnails(filename, output_subfolder))
+        # 無人等待渲染結果，仍需取得例外以避免未處理例外的警告
+        render_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+    page_count = get_page_count(file_location)
+    job = ingest_scheduler.submit(
+        filename,
+        partial(process_rag, file_location, output_subfolder, lang),
+        page_count=page_count,
+        memory=estimate_ocr_memory(page_count),
+        cores=OCR_THREADS,
+        priority=priority,
+    )
+    result = await job.future
+    return len(result)
+
+def process_rag(
+    file_location: str,
+    output_folder: str,
+    lang: str,
+    cancel_event: threading.Event,
+) -> List[str]:
+    """於排程器執行緒中進行 OCR，失敗時拋出例外。"""
+    #result = docling_extract_text_from_file(file_location, output_folder)
+    result = extract_text_from_file(file_location, output_folder, cancel_event=cancel_event, lang=lang)
+    if isinstance(result, str) or (len(result) > 0 and result[0].startswith("錯誤:")):
+        raise RuntimeError(result if isinstance(result, str) else result[0])
+    return result
+
+async def wait_rag_job(filename: str, priority: int, lang: str) -> None:
+    """等待 RAG 處理結束並通知前端；成功時在背景產生文件摘要。
+
+    其他 worker 已在處理同一檔案時，僅等待其結果而不重複 OCR。
+    """
+    output_subfolder = str(OUTPUT_FOLDER / Path(filename).stem)
+    try:
+        await single_flight.do(
+            f"rag:{filename}",
+            partial(run_rag_job, filename, priority, lang),
+            distributed=True,
+            lock_ttl=RAG_LOCK_TTL,
+            result_ttl=RAG_RESULT_TTL,
+        )
+        # 正常情況，處理成功
+        logging.info(f"RAG 處理完成: {filename}")
         rag_status[filename] = True
         await manager.send_status(filename, True)
+        # 背景產生文件摘要，供概要問題直接回答
+        schedule_document_summary(output_subfolder, Path(filename).stem)
+    except JobCancelledError:
+        logging.info(f"RAG 處理已取消: {filename}")
+        rag_errors[filename] = "RAG 處理已取消"
     except Exception as e:
         logging.error(f"RAG 處理異常: {str(e)}", exc_info=True)
-        rag_status[filename] = False
-        await manager.send_status(filename, False)  # 通知前端失敗
+        rag_errors[filename] = str(e)  # 由 WebSocket 迴圈通知前端失敗
 
 @app.websocket("/ws/rag-status/{filename}")
 async def websocket_rag_status(websocket: WebSocket, filename: str):
@@ -279,8 +570,14 @@ async def websocket_rag_status(websocket: WebSocket, filename: str):
     try:
         while True:
             await asyncio.sleep(1)
+            if filename in rag_errors:
+                # 處理失敗或取消，無論連線早於或晚於失敗都會收到錯誤
+                await manager.send_status(filename, False, error=rag_errors[filename])
+                break
             if filename in rag_status:
-                await manager.send_status(filename, rag_status[filename])
+                # 附上已提取頁數，讓前端顯示進度；已完成的頁面即可用於問答
+                pages_done, page_count = get_text_progress(filename, str(OUTPUT_FOLDER / Path(filename).stem))
+                await manager.send_status(filename, rag_status[filename], pages_done, page_count)
                 if rag_status[filename]:  # 僅在成功完成時斷開
                     break
     except WebSocketDisconnect:
@@ -326,4 +623,5 @@ async def call_assistant(request: Request):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # log_config=None：uvicorn 的紀錄交由根 logger 的佇列處理
+    uvicorn.run(app, host="0.0.0.0", port=8000, log_config=None)
@@ -17,6 +17,54 @@ function addMessage(text, sender) {
   chatHistory.insertBefore(messageDiv, chatHistory.firstChild);
 }
 
+/**
+ * 請求檔案縮圖並隨串流逐張顯示。
+ * 後端以 NDJSON 回傳，每行為 {"thumbnail": url} 或 {"error": message}。
+ * @param {string} filename - 檔案名稱。
+ * @param {HTMLElement} screenshotContainer - 截圖顯示容器。
+ */
+async function streamThumbnails(filename, screenshotContainer) {
+  const formData = new FormData();
+  formData.append('file_path', filename);
+  const response = await fetch('/screenshot', {
+    method: 'POST',
+    body: formData,
+  });
+  if (!response.ok) {
+    throw new Error('截圖生成失敗');
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  const handleLine = line => {
+    if (!line.trim()) {
+      return;
+    }
+    const data = JSON.parse(line);
+    if (data.error) {
+      throw new Error(data.error);
+    }
+    const img = document.createElement('img');
+    img.src = data.thumbnail;
+    img.alt = `Page of ${filename}`;
+    img.style.display = 'block';
+    screenshotContainer.appendChild(img);
+  };
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) {
+      break;
+    }
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split('\n');
+    buffer = lines.pop();
+    lines.forEach(handleLine);
+  }
+  handleLine(buffer);
+}
+
 /**
  * 將檔案添加到檔案列表並綁定按鈕事件。
  * @param {Object} fileData - 檔案資訊，包含 filename 和 is_rag_processed。
@@ -86,24 +134,8 @@ function addFileToList(fileData, fileList, screenshotContainer, screenshotFilena
       img.style.display = 'block';
       screenshotContainer.appendChild(img);
     } else if (fileExtension === 'pdf') {
-      const formData = new FormData();
-      formData.append('file_path', filename);
       try {
-        const response = await fetch('/screenshot', {
-          method: 'POST',
-          body: formData,
-        });
-        if (!response.ok) {
-          throw new Error('截圖生成失敗');
-        }
-        const data = await response.json();
-        data.thumbnails.forEach(thumb => {
-          const img = document.createElement('img');
-          img.src = thumb;
-          img.alt = `Page of ${filename}`;
-          img.style.display = 'block';
-          screenshotContainer.appendChild(img);
-        });
+        await streamThumbnails(filename, screenshotContainer);
       } catch (error) {
         console.error('截圖錯誤:', error);
         const img = document.createElement('img');
@@ -132,13 +164,46 @@ function addFileToList(fileData, fileList, screenshotContainer, screenshotFilena
 
       // 初始化計時器
       let secondsElapsed = 0;
+      let pagesProgress = '';
       ragElement.textContent = `RAG 處理中... 經過${secondsElapsed}秒`;
       ragElement.disabled = true; // 禁用按鈕避免重複點擊
       const timer = setInterval(() => {
         secondsElapsed += 5;
-        ragElement.textContent = `RAG 處理中... 經過${secondsElapsed}秒`;
+        ragElement.textContent = `RAG 處理中... 經過${secondsElapsed}秒${pagesProgress}`;
       }, 5000); // 每 5 秒更新一次
 
+      // RAG 狀態 WebSocket；使用者取消時先關閉，不再提示伺服器回報的取消結果
+      let ws = null;
+      let cancelled = false;
+
+      // 取消按鈕，處理結束後移除
+      const cancelButton = document.createElement('button');
+      cancelButton.textContent = '取消';
+      cancelButton.className = 'cancel-button';
+      cancelButton.addEventListener('click', async () => {
+        console.log('取消 RAG 處理:', filename);
+        cancelled = true;
+        if (ws) {
+          ws.close();
+        }
+        try {
+          await fetch('/rag-cancel', {
+            method: 'POST',
+            headers: {
+              'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ filename }),
+          });
+        } catch (error) {
+          console.error('取消 RAG 處理錯誤:', error);
+        }
+        clearInterval(timer);
+        cancelButton.remove();
+        ragElement.textContent = 'RAG 處理';
+        ragElement.disabled = false;
+      });
+      li.appendChild(cancelButton);
+
       try {
         // 啟動 RAG 處理
         const response = await fetch('/rag', {
@@ -150,8 +215,12 @@ function addFileToList(fileData, fileList, screenshotContainer, screenshotFilena
         });
         const data = await response.json();
 
+        if (cancelled) {
+          return;
+        }
         if (!response.ok) {
           clearInterval(timer);
+          cancelButton.remove();
           console.error('RAG 處理啟動失敗:', data.error);
           alert(`RAG 處理啟動失敗: ${data.error}`);
           ragElement.textContent = 'RAG 處理';
@@ -166,15 +235,27 @@ function addFileToList(fileData, fileList, screenshotContainer, screenshotFilena
         screenshotFilename.textContent = filename;
 
         // 建立 WebSocket 連線
-        const ws = new WebSocket(`wss://${window.location.host}/ws/rag-status/${filename}`);
+        ws = new WebSocket(`wss://${window.location.host}/ws/rag-status/${filename}`);
         ws.onopen = () => {
           console.log('WebSocket 連線建立:', filename);
         };
         ws.onmessage = async (event) => {
+          if (cancelled) {
+            return;
+          }
           const data = JSON.parse(event.data);
           console.log('WebSocket 收到訊息:', data);
           if (data.filename && data.filename === filename) {  // 確保 filename 存在
+            if (!data.is_complete && !data.error) {
+              // 處理中：顯示已完成頁數，已完成的頁面即可用於問答
+              if (data.page_count) {
+                pagesProgress = `，已完成 ${data.pages_done}/${data.page_count} 頁`;
+                ragElement.textContent = `RAG 處理中... 經過${secondsElapsed}秒${pagesProgress}`;
+              }
+              return;
+            }
             clearInterval(timer);
+            cancelButton.remove();
             if (data.is_complete) {
               li.classList.add('rag-processed');
               li.removeChild(ragElement);
@@ -191,25 +272,12 @@ function addFileToList(fileData, fileList, screenshotContainer, screenshotFilena
                 return;
               }
         
-              const formData = new FormData();
-              formData.append('file_path', filename);
-              const screenshotResponse = await fetch('/screenshot', {
-                method: 'POST',
-                body: formData,
-              });
-              if (screenshotResponse.ok) {
-                const screenshotData = await screenshotResponse.json();
-                screenshotContainer.innerHTML = '';
-                screenshotFilename.textContent = filename;
-                screenshotData.thumbnails.forEach(thumb => {
-                  const img = document.createElement('img');
-                  img.src = thumb;
-                  img.alt = `Page of ${filename}`;
-                  img.style.display = 'block';
-                  screenshotContainer.appendChild(img);
-                });
-              } else {
-                console.error('無法獲取縮圖:', screenshotResponse.statusText);
+              screenshotContainer.innerHTML = '';
+              screenshotFilename.textContent = filename;
+              try {
+                await streamThumbnails(filename, screenshotContainer);
+              } catch (error) {
+                console.error('無法獲取縮圖:', error);
                 alert('無法顯示縮圖，請稍後再試');
               }
             } else if (data.error) {
@@ -222,7 +290,11 @@ function addFileToList(fileData, fileList, screenshotContainer, screenshotFilena
           }
         };
         ws.onerror = (error) => {
+          if (cancelled) {
+            return;
+          }
           clearInterval(timer);
+          cancelButton.remove();
           console.error('WebSocket 錯誤:', error);
           alert('RAG 狀態監控失敗，請稍後重試');
           ragElement.textContent = 'RAG 處理';
@@ -233,6 +305,7 @@ function addFileToList(fileData, fileList, screenshotContainer, screenshotFilena
         };
       } catch (error) {
         clearInterval(timer);
+        cancelButton.remove();
         console.error('RAG 處理錯誤:', error.message);
         alert('RAG 處理發生異常: ' + error.message);
         ragElement.textContent = 'RAG 處理';
@@ -326,6 +399,11 @@ document.addEventListener('DOMContentLoaded', () => {
       if (chatId) {
         formData.append('chat_id', chatId);
       }
+      // 附上目前預覽中的文件，讓回答可參考該文件的摘要與內容
+      const currentFilename = document.getElementById('screenshot-filename').textContent.trim();
+      if (currentFilename) {
+        formData.append('filename', currentFilename);
+      }
 
       console.log('發送聊天請求...');
       const response = await fetch('/chat-submit', {
@@ -0,0 +1,412 @@
+# utils/artifact_store.py
+"""
+文件產物封裝模組，將每份文件的頁面文字與縮圖封裝為單一檔案。
+
+封裝檔格式（僅追加寫入）：
+    檔頭      MAGIC（8 bytes）
+    資料區塊  每次提交追加的壓縮頁面文字、縮圖與中繼資料
+    索引      (種類, 頁碼, 偏移, 長度, 編碼) 的列表
+    檔尾      索引偏移、索引長度、索引 CRC32 與索引標記
+
+讀取時以記憶體映射（mmap）開啟並解析最後一份索引，取得第 N 頁文字或縮圖只需一次切片。
+已寫入的資料區塊永不改動，因此已開啟的讀取者不受後續追加影響。
+"""
+
+import os
+import re
+import json
+import mmap
+import zlib
+import fcntl
+import hashlib
+import time
+import struct
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"KAPIPK01"
+INDEX_MAGIC = b"KAPIIDX1"
+PACK_SUFFIX = ".pack"
+
+# 產物種類
+KIND_TEXT = 1
+KIND_THUMBNAIL = 2
+KIND_META = 3
+KIND_SUMMARY = 4
+
+# 資料編碼
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+
+_INDEX_ENTRY = struct.Struct("<BIQIB")   # 種類、頁碼、偏移、長度、編碼
+_INDEX_HEADER = struct.Struct("<I")      # 索引項目數
+_FOOTER = struct.Struct("<QII8s")        # 索引偏移、索引長度、CRC32、標記
+
+# 讀取者快取上限（每個封裝檔一個 mmap）
+PACK_CACHE_SIZE = 64
+# 讀到寫入中不完整的尾端時的重試次數與間隔（秒）
+PACK_OPEN_RETRIES = 3
+PACK_OPEN_RETRY_DELAY = 0.002
+
+# pdf2image 以 output_folder 轉換時遺留的中間檔案（uuid4-頁碼.副檔名）
+_INTERMEDIATE_RENDER_PATTERN = re.compile(
+    r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}-\d+\.(jpg|jpeg|ppm|png|tif|tiff)$"
+)
+
+def artifact_pack_path(output_folder: str, base_filename: str) -> Path:
+    """回傳文件產物封裝檔路徑（output/<filename>/<filename>.pack）。"""
+    return Path(output_folder) / f"{base_filename}{PACK_SUFFIX}"
+
+class ArtifactPack:
+    """
+    以 mmap 開啟的唯讀產物封裝檔。
+
+    開啟時不取得檔案鎖：資料只會追加，壓實則以 os.replace 原子替換，
+    因此讀者只可能讀到寫入中的不完整尾端，此時檔尾標記或索引 CRC 校驗會失敗並拋出 ValueError。
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._index: Dict[Tuple[int, int], Tuple[int, int, int]] = {}
+        with self.path.open("rb") as file_handle:
+            stat = os.fstat(file_handle.fileno())
+            if stat.st_size < len(MAGIC) + _FOOTER.size:
+                raise ValueError(f"封裝檔不完整: {self.path}")
+            self._mmap = mmap.mmap(file_handle.fileno(), stat.st_size, access=mmap.ACCESS_READ)
+        # 供讀取者快取判斷檔案是否已追加或替換
+        self.stat_key = (stat.st_ino, stat.st_size)
+        try:
+            if self._mmap[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"不是有效的封裝檔: {self.path}")
+            self._index = _parse_index(self._mmap, len(self._mmap))
+        except Exception:
+            self._mmap.close()
+            raise
+
+    def close(self) -> None:
+        self._mmap.close()
+
+    def _read(self, kind: int, page: int) -> Optional[bytes]:
+        entry = self._index.get((kind, page))
+        if entry is None:
+            return None
+        offset, length, codec = entry
+        data = self._mmap[offset:offset + length]
+        return zlib.decompress(data) if codec == CODEC_ZLIB else data
+
+    def pages(self, kind: int) -> List[int]:
+        """回傳指定種類已存在的頁碼（遞增排序）。"""
+        return sorted(page for entry_kind, page in self._index if entry_kind == kind)
+
+    def contiguous_pages(self, kind: int) -> int:
+        """回傳從第 1 頁起連續存在的頁數。"""
+        count = 0
+        while (kind, count + 1) in self._index:
+            count += 1
+        return count
+
+    def read_text(self, page: int) -> Optional[str]:
+        """讀取第 page 頁（從 1 開始）的文字，若不存在則返回 None。"""
+        data = self._read(KIND_TEXT, page)
+        return data.decode("utf-8") if data is not None else None
+
+    def read_thumbnail(self, page: int) -> Optional[bytes]:
+        """讀取第 page 頁（從 1 開始）的 PNG 縮圖，若不存在則返回 None。"""
+        return self._read(KIND_THUMBNAIL, page)
+
+    def read_meta(self) -> dict:
+        """讀取文件中繼資料（例如 page_count），若不存在則返回空字典。"""
+        data = self._read(KIND_META, 0)
+        return json.loads(data) if data is not None else {}
+
+    def read_summary(self) -> Optional[dict]:
+        """讀取文件摘要，若不存在則返回 None。"""
+        data = self._read(KIND_SUMMARY, 0)
+        return json.loads(data) if data is not None else None
+
+def _parse_index(buffer, size: int) -> Dict[Tuple[int, int], Tuple[int, int, int]]:
+    """解析封裝檔尾端指向的最新索引。"""
+    index_offset, index_length, index_crc, index_magic = _FOOTER.unpack_from(buffer, size - _FOOTER.size)
+    if index_magic != INDEX_MAGIC:
+        raise ValueError("封裝檔索引標記錯誤")
+    index_bytes = bytes(buffer[index_offset:index_offset + index_length])
+    if zlib.crc32(index_bytes) != index_crc:
+        raise ValueError("封裝檔索引校驗失敗")
+    (count,) = _INDEX_HEADER.unpack_from(index_bytes, 0)
+    index = {}
+    for i in range(count):
+        kind, page, offset, length, codec = _INDEX_ENTRY.unpack_from(
+            index_bytes, _INDEX_HEADER.size + i * _INDEX_ENTRY.size
+        )
+        index[(kind, page)] = (offset, length, codec)
+    return index
+
+def content_hash(texts: List[str]) -> str:
+    """計算頁面文字的內容雜湊；於文字提取完成時寫入中繼資料，用於判斷摘要是否過期。"""
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def _pack_index(index: Dict[Tuple[int, int], Tuple[int, int, int]]) -> bytes:
+    """將索引序列化為位元組（依種類與頁碼排序）。"""
+    return _INDEX_HEADER.pack(len(index)) + b"".join(
+        _INDEX_ENTRY.pack(kind, page, offset, length, codec)
+        for (kind, page), (offset, length, codec) in sorted(index.items())
+    )
+
+@contextmanager
+def _locked_pack(path: Path, mode: str) -> Iterator:
+    """
+    開啟封裝檔並持有獨占鎖。
+
+    若等待鎖期間檔案已被壓實替換（路徑指向新的 inode），改開新檔重試，
+    避免寫入已被取代的舊檔而遺失資料。
+    """
+    while True:
+        file_handle = path.open(mode)
+        fcntl.flock(file_handle, fcntl.LOCK_EX)
+        try:
+            if os.fstat(file_handle.fileno()).st_ino == os.stat(path).st_ino:
+                break
+        except FileNotFoundError:
+            pass
+        fcntl.flock(file_handle, fcntl.LOCK_UN)
+        file_handle.close()
+    try:
+        yield file_handle
+    finally:
+        fcntl.flock(file_handle, fcntl.LOCK_UN)
+        file_handle.close()
+
+# 全域讀取者快取：路徑 -> ((inode, 大小), ArtifactPack)
+_pack_cache: "OrderedDict[str, Tuple[Tuple[int, int], ArtifactPack]]" = OrderedDict()
+_pack_cache_lock = threading.Lock()
+
+def open_artifact_pack(path: Path) -> Optional[ArtifactPack]:
+    """
+    開啟封裝檔並快取讀取者；檔案追加或替換後自動重新開啟。
+
+    開啟不持有全域快取鎖也不等待檔案鎖，可在事件迴圈中直接呼叫。讀到寫入中的不完整尾端時
+    短暫重試，仍失敗則沿用快取中的前一版讀取者。
+
+    Args:
+        path (Path): 封裝檔路徑。
+
+    Returns:
+        Optional[ArtifactPack]: 讀取者，若檔案不存在或無效則返回 None。
+    """
+    path = Path(path)
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    stat_key = (stat.st_ino, stat.st_size)
+    cache_key = str(path)
+    with _pack_cache_lock:
+        cached = _pack_cache.get(cache_key)
+        if cached is not None and cached[0] == stat_key:
+            _pack_cache.move_to_end(cache_key)
+            return cached[1]
+
+    pack = None
+    for attempt in range(PACK_OPEN_RETRIES):
+        try:
+            pack = ArtifactPack(path)
+            break
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, struct.error) as error:
+            if attempt == PACK_OPEN_RETRIES - 1:
+                if cached is not None:
+                    return cached[1]
+                logger.error("無法開啟封裝檔", extra={"path": str(path), "error": str(error)})
+                return None
+            time.sleep(PACK_OPEN_RETRY_DELAY)
+
+    with _pack_cache_lock:
+        _pack_cache[cache_key] = (pack.stat_key, pack)
+        _pack_cache.move_to_end(cache_key)
+        while len(_pack_cache) > PACK_CACHE_SIZE:
+            _pack_cache.popitem(last=False)
+    return pack
+
+def write_artifacts(
+    path: Path,
+    texts: Optional[Dict[int, str]] = None,
+    thumbnails: Optional[Dict[int, bytes]] = None,
+    meta: Optional[dict] = None,
+    summary: Optional[dict] = None,
+    drop_kinds: Iterable[int] = (),
+    create: bool = True,
+) -> None:
+    """
+    將頁面文字、縮圖、中繼資料與摘要追加寫入封裝檔，並寫入新的索引。
+
+    相同頁碼的既有項目會被新資料取代（舊資料留待壓實時清除）；中繼資料以鍵合併。
+
+    Args:
+        path (Path): 封裝檔路徑，不存在時依 create 決定是否建立。
+        texts (Optional[Dict[int, str]]): 頁碼（從 1 開始）對應的文字。
+        thumbnails (Optional[Dict[int, bytes]]): 頁碼對應的 PNG 縮圖。
+        meta (Optional[dict]): 要合併的中繼資料。
+        summary (Optional[dict]): 文件摘要，整份取代既有摘要。
+        drop_kinds (Iterable[int]): 先從索引移除的產物種類（例如重新提取前清除 KIND_TEXT）。
+        create (bool): 封裝檔不存在時是否建立；為 False 時拋出 FileNotFoundError，
+            避免檔案移除後仍在執行的渲染重新建立孤立的封裝檔。
+
+    Raises:
+        FileNotFoundError: create 為 False 且封裝檔不存在。
+    """
+    path = Path(path)
+    if create:
+        path.parent.mkdir(parents=True, exist_ok=True)
+    # rb+ 不會建立檔案；寫入前已移至檔尾，效果同追加
+    with _locked_pack(path, "ab+" if create else "rb+") as file_handle:
+        file_handle.seek(0, os.SEEK_END)
+        size = file_handle.tell()
+        index: Dict[Tuple[int, int], Tuple[int, int, int]] = {}
+        existing_meta: dict = {}
+        if size == 0:
+            file_handle.write(MAGIC)
+        else:
+            with mmap.mmap(file_handle.fileno(), size, access=mmap.ACCESS_READ) as buffer:
+                index = _parse_index(buffer, size)
+                if meta and (KIND_META, 0) in index:
+                    offset, length, codec = index[(KIND_META, 0)]
+                    data = buffer[offset:offset + length]
+                    existing_meta = json.loads(zlib.decompress(data) if codec == CODEC_ZLIB else data)
+
+        drop_kinds = set(drop_kinds)
+        if drop_kinds:
+            index = {key: entry for key, entry in index.items() if key[0] not in drop_kinds}
+
+        chunks = []
+        offset = file_handle.tell()
+
+        def add(kind: int, page: int, data: bytes, codec: int) -> None:
+            nonlocal offset
+            index[(kind, page)] = (offset, len(data), codec)
+            chunks.append(data)
+            offset += len(data)
+
+        for page, text in (texts or {}).items():
+            add(KIND_TEXT, page, zlib.compress(text.encode("utf-8")), CODEC_ZLIB)
+        for page, image_bytes in (thumbnails or {}).items():
+            add(KIND_THUMBNAIL, page, image_bytes, CODEC_RAW)  # PNG 本身已壓縮
+        if meta:
+            existing_meta.update(meta)
+            add(KIND_META, 0, zlib.compress(json.dumps(existing_meta).encode("utf-8")), CODEC_ZLIB)
+        if summary is not None:
+            add(KIND_SUMMARY, 0, zlib.compress(json.dumps(summary).encode("utf-8")), CODEC_ZLIB)
+
+        index_bytes = _pack_index(index)
+        chunks.append(index_bytes)
+        chunks.append(_FOOTER.pack(offset, len(index_bytes), zlib.crc32(index_bytes), INDEX_MAGIC))
+        file_handle.write(b"".join(chunks))
+        file_handle.flush()
+
+def compact_artifact_pack(path: Path) -> None:
+    """
+    重寫封裝檔，僅保留最新索引引用的資料，移除被取代的舊區塊與舊索引。
+
+    讀取、寫入暫存檔與替換的整個過程都持有原檔的獨占鎖；期間到達的追加寫入會等待，
+    並在替換完成後寫入新檔。
+    """
+    path = Path(path)
+    temp_path = path.with_suffix(PACK_SUFFIX + ".tmp")
+    with _locked_pack(path, "rb") as file_handle:
+        size = os.fstat(file_handle.fileno()).st_size
+        with mmap.mmap(file_handle.fileno(), size, access=mmap.ACCESS_READ) as buffer:
+            index = _parse_index(buffer, size)
+            compacted: Dict[Tuple[int, int], Tuple[int, int, int]] = {}
+            with temp_path.open("wb") as temp_handle:
+                temp_handle.write(MAGIC)
+                offset = len(MAGIC)
+                # 資料區塊原樣複製，不需重新壓縮
+                for key, (entry_offset, length, codec) in sorted(index.items()):
+                    temp_handle.write(buffer[entry_offset:entry_offset + length])
+                    compacted[key] = (offset, length, codec)
+                    offset += length
+                index_bytes = _pack_index(compacted)
+                temp_handle.write(index_bytes)
+                temp_handle.write(_FOOTER.pack(offset, len(index_bytes), zlib.crc32(index_bytes), INDEX_MAGIC))
+                temp_handle.flush()
+                os.fsync(temp_handle.fileno())
+        os.replace(temp_path, path)
+
+def remove_intermediate_renders(output_folder: str) -> int:
+    """刪除 pdf2image 遺留在輸出目錄中的中間渲染檔，回傳刪除數量。"""
+    removed = 0
+    for file_path in Path(output_folder).iterdir():
+        if file_path.is_file() and _INTERMEDIATE_RENDER_PATTERN.match(file_path.name):
+            file_path.unlink()
+            removed += 1
+    return removed
+
+def migrate_output_folder(output_folder: str, remove_originals: bool = True) -> Optional[Path]:
+    """
+    將舊版輸出目錄（每頁一個 _page_N.txt 與 _page_N.png）轉換為封裝檔。
+
+    Args:
+        output_folder (str): 文件輸出子目錄（例如 output/<filename>）。
+        remove_originals (bool): 轉換後是否刪除原始頁面檔案與中間渲染檔。
+
+    Returns:
+        Optional[Path]: 封裝檔路徑，若目錄中無可轉換的檔案則返回 None。
+    """
+    output_dir = Path(output_folder)
+    base_filename = output_dir.name
+    page_pattern = re.compile(rf"^{re.escape(base_filename)}_page_(\d+)\.(txt|png)$")
+    texts: Dict[int, str] = {}
+    thumbnails: Dict[int, bytes] = {}
+    migrated_files = []
+    for file_path in output_dir.iterdir():
+        match = page_pattern.match(file_path.name)
+        if not match:
+            continue
+        page = int(match.group(1))
+        if match.group(2) == "txt":
+            texts[page] = file_path.read_text(encoding="utf-8")
+        else:
+            thumbnails[page] = file_path.read_bytes()
+        migrated_files.append(file_path)
+
+    pack_path = None
+    if migrated_files:
+        pack_path = artifact_pack_path(output_folder, base_filename)
+        meta = {"page_count": max(list(texts) + list(thumbnails))}
+        if texts and len(texts) == meta["page_count"]:
+            meta["text_complete"] = True
+            meta["content_hash"] = content_hash([texts[page] for page in sorted(texts)])
+        write_artifacts(pack_path, texts, thumbnails, meta)
+        compact_artifact_pack(pack_path)
+
+    if remove_originals:
+        for file_path in migrated_files:
+            file_path.unlink()
+        remove_intermediate_renders(output_folder)
+    return pack_path
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="將舊版輸出目錄轉換為產物封裝檔")
+    parser.add_argument("output_root", help="輸出根目錄（例如 app/output）")
+    parser.add_argument("--keep-originals", action="store_true", help="保留原始頁面檔案與中間渲染檔")
+    args = parser.parse_args()
+
+    from utils.logging_utils import setup_logging
+    setup_logging()
+    for folder in sorted(Path(args.output_root).iterdir()):
+        if folder.is_dir():
+            pack_path = migrate_output_folder(str(folder), remove_originals=not args.keep_originals)
+            if pack_path:
+                logger.info("已轉換輸出目錄", extra={"folder": str(folder), "path": str(pack_path)})
@@ -0,0 +1,218 @@
+# utils/job_scheduler.py
+"""
+文件處理排程模組，依可用 CPU 核心與預估記憶體決定同時執行的 OCR 工作，並支援優先權與取消。
+"""
+
+import os
+import heapq
+import asyncio
+import logging
+import itertools
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 工作優先權（數值越小越優先）
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+# 記憶體預算可用環境變數覆寫（MB），預設為實體記憶體的一半
+INGEST_MEMORY_BUDGET_MB = os.environ.get("INGEST_MEMORY_BUDGET_MB")
+
+class JobCancelledError(Exception):
+    """工作在執行前或執行中被取消。"""
+
+def _default_memory_budget() -> int:
+    """回傳預設記憶體預算（位元組）。"""
+    if INGEST_MEMORY_BUDGET_MB:
+        return int(INGEST_MEMORY_BUDGET_MB) * 1024 * 1024
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2
+    except (ValueError, OSError, AttributeError):
+        return 4 * 1024 ** 3
+
+@dataclass
+class IngestJob:
+    """單一排程工作。func 於執行緒中執行，並接收取消事件作為參數。"""
+    key: str
+    func: Callable[[threading.Event], object]
+    priority: int
+    cores: int
+    memory: int
+    page_count: int
+    seq: int
+    future: asyncio.Future
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+    state: str = "queued"  # queued、running、done、failed、cancelled
+
+    def sort_key(self) -> tuple:
+        # 互動請求優先，其次頁數少者優先，最後依提交順序
+        return (self.priority, self.page_count, self.seq)
+
+class IngestScheduler:
+    """
+    依資源准入的工作排程器。
+
+    佇列依（優先權、頁數、提交順序）排序；佇首工作在核心數與預估記憶體皆足夠時才開始執行。
+    沒有任何工作執行時，佇首工作一律放行，避免超過預算的大型文件永遠無法執行。
+    """
+
+    def __init__(self, total_cores: Optional[int] = None, memory_budget: Optional[int] = None):
+        self.total_cores = total_cores or os.cpu_count() or 1
+        self.memory_budget = memory_budget or _default_memory_budget()
+        self._queue: List[tuple] = []
+        self._jobs: Dict[str, IngestJob] = {}
+        self._running: Dict[str, IngestJob] = {}
+        self._seq = itertools.count()
+
+    @property
+    def used_cores(self) -> int:
+        return sum(job.cores for job in self._running.values())
+
+    @property
+    def used_memory(self) -> int:
+        return sum(job.memory for job in self._running.values())
+
+    def get_job(self, key: str) -> Optional[IngestJob]:
+        """回傳排隊中或執行中的工作。"""
+        return self._jobs.get(key)
+
+    def submit(
+        self,
+        key: str,
+        func: Callable[[threading.Event], object],
+        page_count: int,
+        memory: int,
+        cores: int = 1,
+        priority: int = PRIORITY_INTERACTIVE,
+    ) -> IngestJob:
+        """
+        提交工作；相同 key 的工作尚未結束時直接返回既有工作。
+
+        Args:
+            key (str): 工作識別（例如檔案名稱）。
+            func (Callable[[threading.Event], object]): 於執行緒中執行的工作函式。
+            page_count (int): 文件頁數，用於排序。
+            memory (int): 預估記憶體用量（位元組）。
+            cores (int): 預估使用的核心數。
+            priority (int): PRIORITY_INTERACTIVE 或 PRIORITY_BATCH。
+
+        Returns:
+            IngestJob: 工作物件，可等待 job.future 取得結果。
+        """
+        existing = self._jobs.get(key)
+        if existing is not None:
+            self.promote(key, priority)
+            return existing
+
+        job = IngestJob(
+            key=key,
+            func=func,
+            priority=priority,
+            cores=min(cores, self.total_cores),
+            memory=memory,
+            page_count=page_count,
+            seq=next(self._seq),
+            future=asyncio.get_running_loop().create_future(),
+        )
+        self._jobs[key] = job
+        heapq.heappush(self._queue, (job.sort_key(), job.seq, job))
+        logger.info("工作已排入佇列", extra={"job": key, "page_count": page_count, "memory_mb": memory // (1024 * 1024), "priority": priority})
+        self._dispatch()
+        return job
+
+    def promote(self, key: str, priority: int) -> None:
+        """提升排隊中工作的優先權（例如互動請求取代既有批次工作）。"""
+        job = self._jobs.get(key)
+        if job is None or job.state != "queued" or priority >= job.priority:
+            return
+        job.priority = priority
+        self._queue = [(queued.sort_key(), queued.seq, queued) for _, _, queued in self._queue]
+        heapq.heapify(self._queue)
+        self._dispatch()
+
+    async def cancel(self, key: str) -> bool:
+        """
+        取消工作；執行中的工作會在下一個檢查點停止，並等待其執行緒真正結束後才返回，
+        呼叫端可安全刪除工作使用的檔案。
+
+        Args:
+            key (str): 工作識別。
+
+        Returns:
+            bool: 是否有工作被取消。
+        """
+        job = self._jobs.get(key)
+        if job is None:
+            return False
+        job.cancel_event.set()
+        if job.state == "queued":
+            job.state = "cancelled"
+            del self._jobs[key]
+            self._queue = [entry for entry in self._queue if entry[2] is not job]
+            heapq.heapify(self._queue)
+            job.future.set_exception(JobCancelledError(key))
+            job.future.exception()  # 標記例外已取得，避免未等待時的警告
+            logger.info("已取消排隊中的工作", extra={"job": key})
+            return True
+        logger.info("已要求停止執行中的工作", extra={"job": key})
+        try:
+            await asyncio.shield(job.future)
+        except Exception:
+            pass
+        return True
+
+    def _can_admit(self, job: IngestJob) -> bool:
+        if not self._running:
+            return True
+        return (
+            self.used_cores + job.cores <= self.total_cores
+            and self.used_memory + job.memory <= self.memory_budget
+        )
+
+    def _dispatch(self) -> None:
+        """依序放行佇首工作，直到資源不足。"""
+        while self._queue:
+            job = self._queue[0][2]
+            if not self._can_admit(job):
+                break
+            heapq.heappop(self._queue)
+            job.state = "running"
+            self._running[job.key] = job
+            asyncio.get_running_loop().create_task(self._run(job))
+
+    async def _run(self, job: IngestJob) -> None:
+        logger.info("工作開始執行", extra={"job": job.key, "used_cores": self.used_cores, "total_cores": self.total_cores})
+        try:
+            result = await asyncio.to_thread(job.func, job.cancel_event)
+            if job.cancel_event.is_set():
+                raise JobCancelledError(job.key)
+            job.state = "done"
+            job.future.set_result(result)
+        except Exception as error:
+            if job.cancel_event.is_set():
+                job.state = "cancelled"
+                error = JobCancelledError(job.key)
+            else:
+                job.state = "failed"
+            job.future.set_exception(error)
+            job.future.exception()
+        finally:
+            self._running.pop(job.key, None)
+            if self._jobs.get(job.key) is job:
+                del self._jobs[job.key]
+            logger.info("工作結束", extra={"job": job.key, "state": job.state})
+            self._dispatch()
+
+    def status(self) -> dict:
+        """回傳排程器目前狀態。"""
+        return {
+            "total_cores": self.total_cores,
+            "used_cores": self.used_cores,
+            "memory_budget": self.memory_budget,
+            "used_memory": self.used_memory,
+            "running": list(self._running),
+            "queued": [entry[2].key for entry in sorted(self._queue)],
+        }
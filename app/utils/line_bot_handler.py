@@ -3,6 +3,7 @@
 Line Bot 處理模組，提供問答與助理功能的 Webhook 處理。
 """
 
+import os
 import logging
 from linebot.v3 import WebhookParser
 from linebot.v3.exceptions import InvalidSignatureError
@@ -10,26 +11,26 @@ from linebot.v3.webhooks import MessageEvent, TextMessageContent
 from linebot.v3.messaging import (
     AsyncMessagingApi,
     Configuration,
-    ApiClient,
+    AsyncApiClient,
     ReplyMessageRequest,
     TextMessage
 )
 from fastapi import HTTPException
 from utils.llm_utils import llm_invoke
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# 配置 LINE Bot
-channel_access_token = 'channel_access_token'
-channel_secret = 'channel_secret'
-channel_access_token2 = 'channel_access_token2'
-channel_secret2 = 'channel_secret2'
+# 配置 LINE Bot（可用環境變數覆寫，例如於負載測試時指向本地模擬伺服器）
+CHANNEL_ACCESS_TOKEN = os.environ.get("LINE_CHANNEL_ACCESS_TOKEN", 'channel_access_token')
+CHANNEL_SECRET = os.environ.get("LINE_CHANNEL_SECRET", 'channel_secret')
+CHANNEL_ACCESS_TOKEN2 = os.environ.get("LINE_CHANNEL_ACCESS_TOKEN2", 'channel_access_token2')
+CHANNEL_SECRET2 = os.environ.get("LINE_CHANNEL_SECRET2", 'channel_secret2')
+LINE_API_HOST = os.environ.get("LINE_API_HOST", "https://api.line.me")
 
 # 初始化 Webhook 處理器和配置
-CONFIGURATION = Configuration(access_token=CHANNEL_ACCESS_TOKEN)
+CONFIGURATION = Configuration(access_token=CHANNEL_ACCESS_TOKEN, host=LINE_API_HOST)
 PARSER = WebhookParser(CHANNEL_SECRET)
-CONFIGURATION2 = Configuration(access_token=CHANNEL_ACCESS_TOKEN2)
+CONFIGURATION2 = Configuration(access_token=CHANNEL_ACCESS_TOKEN2, host=LINE_API_HOST)
 PARSER2 = WebhookParser(CHANNEL_SECRET2)
 
 async def handle_line_ask_message(body_str: str, signature: str) -> None:
@@ -49,24 +50,23 @@ async def handle_line_ask_message(body_str: str, signature: str) -> None:
         raise HTTPException(status_code=500, detail="Internal server error") from None
 
 async def process_ask_message(event: MessageEvent) -> None:
-    logger.info("處理問答訊息")
-    logger.info(f"事件內容：{event}")
+    logger.info("處理問答訊息", extra={"event_id": event.webhook_event_id, "user_id": event.source.user_id})
 
     # 跳過重發事件
     if event.delivery_context.is_redelivery:
         logger.info("此事件為重發事件，跳過處理")
         return
 
-    with ApiClient(CONFIGURATION) as api_client:
+    async with AsyncApiClient(CONFIGURATION) as api_client:
         line_user_id = event.source.user_id
-        logger.info(f"Line 使用者 ID: {line_user_id}, 問題: {event.message.text}")
+        logger.debug("Line 使用者問題", extra={"user_id": line_user_id, "question": event.message.text})
 
         response = await llm_invoke('line-ask', line_user_id, event.message.text)
-        logger.info(f"AI 回應: {response}")
+        logger.info("AI 回應完成", extra={"user_id": line_user_id, "response_chars": len(response)})
 
         line_bot_api = AsyncMessagingApi(api_client)
         try:
-            line_bot_api.reply_message(
+            await line_bot_api.reply_message(
                 ReplyMessageRequest(
                     reply_token=event.reply_token,
                     messages=[TextMessage(text=response)]
@@ -97,24 +97,23 @@ async def handle_line_assistant_message(body_str: str, signature: str) -> None:
         raise HTTPException(status_code=500, detail="Internal server error") from None
 
 async def process_assistant_message(event: MessageEvent) -> None:
-    logger.info("處理助理訊息")
-    logger.info(f"事件內容：{event}")
+    logger.info("處理助理訊息", extra={"event_id": event.webhook_event_id, "user_id": event.source.user_id})
 
     # 跳過重發事件
     if event.delivery_context.is_redelivery:
         logger.info("此事件為重發事件，跳過處理")
         return
 
-    with ApiClient(CONFIGURATION2) as api_client:
+    async with AsyncApiClient(CONFIGURATION2) as api_client:
         line_user_id = event.source.user_id
-        logger.info(f"Line 使用者 ID: {line_user_id}, 問題: {event.message.text}")
+        logger.debug("Line 使用者問題", extra={"user_id": line_user_id, "question": event.message.text})
 
         response = await llm_invoke('line-assistant', line_user_id, event.message.text)
-        logger.info(f"賽巴斯欽回應: {response}")
+        logger.info("賽巴斯欽回應完成", extra={"user_id": line_user_id, "response_chars": len(response)})
 
         line_bot_api = AsyncMessagingApi(api_client)
         try:
-            line_bot_api.reply_message(
+            await line_bot_api.reply_message(
                 ReplyMessageRequest(
                     reply_token=event.reply_token,
                     messages=[TextMessage(text=response)]
@@ -4,30 +4,37 @@
 """
 
 import os
+import json
 import asyncio
+import hashlib
 import time
 import logging
+from typing import Optional
 from langchain_openai.chat_models import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.output_parsers import StrOutputParser
 from langchain.globals import set_llm_cache
 from langchain_community.cache import InMemoryCache
 from utils.redis_utils import get_redis_history_chat, update_redis_history_chat
+from utils.singleflight import SingleFlight
+from utils.memory_utils import format_memories, recall_memories, remember_turn
 
-# 設置日誌
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 os.environ["OPENAI_API_KEY"] = 'OPENAI_API_KEY'
-os.environ['TAVILY_API_KEY'] = 'TAVILY_API_KEY
+os.environ['TAVILY_API_KEY'] = 'TAVILY_API_KEY'
 
 # 啟用 LLM 快取
 set_llm_cache(InMemoryCache())
 
 # 定義模型與參數
 LLM_MODEL = "gpt-4o-mini"
+# 可用 OPENAI_BASE_URL 指向相容 OpenAI API 的伺服器（例如負載測試的本地模擬伺服器）
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL")
 LLM = ChatOpenAI(
     model=LLM_MODEL,
+    base_url=OPENAI_BASE_URL,
     cache=True,
     temperature=0.7,
     max_tokens=None,
@@ -38,8 +45,90 @@ LLM = ChatOpenAI(
 
 STR_PARSER = StrOutputParser()
 
+# 合併相同提示的並行 LLM 請求（跨 worker 透過 Redis）
+LLM_FLIGHT = SingleFlight()
+LLM_FLIGHT_LOCK_TTL = 60
+LLM_FLIGHT_RESULT_TTL = 10
+
+# 提示中重播的近期對話訊息數；更早的對話改由長期記憶檢索相關片段
+RECENT_HISTORY_MESSAGES = 12
+
+# 各模式的系統指令。指令為固定內容且置於提示最前方，使每次請求共享相同前綴，
+# 以利供應商端的提示快取（例如 OpenAI 對 1024 tokens 以上的相同前綴自動快取）
+BASE_INSTRUCTION = """你是一位負責處理使用者問題的助手，具備廣泛的知識和專業能力。
+請根據使用者的問題，提供準確、實用且連貫的回答，參考對話歷史確保上下文一致。
+若無法確定答案，誠實告知並建議尋求其他資源，切勿虛構資訊。
+根據使用者語言回應，若語言不明顯，預設使用中文"""
+
+LINE_ASSISTANT_INSTRUCTION = """我是賽巴斯欽・米卡艾利斯，一名執事，同時也是凡多姆海伍家的忠實僕人。
+我的本質是一名惡魔，原形為烏鴉，因此人類的攻擊對我無效。
+我與我的主人謝爾・凡多姆海伍簽訂了契約，左手上背刻有契約的魔法陣（平時以白手套遮蓋），證明我對他的忠誠。
+
+關於我的名字與背景:
+「賽巴斯欽」並非我的本名，而是謝爾為我取的名字，靈感來自凡多姆海伍家族曾飼養的一隻寵物犬。
+死神格雷爾曾戲稱我為「賽巴斯小子」（音似「セバスチャン」）。
+我的名字可能與歷史上法蘭德斯地區（今比利時、法國一帶）的宗教家 Sebastian Michaelis 有關。
+
+我的個性與特點:
+我擁有完美的品格、修養、知識與外貌，但私底下有些腹黑，表面上溫文爾雅，心中卻可能暗自毒舌評論他人。
+我熱愛貓科動物（特別是黑貓），喜歡按壓牠們的肉球（偶爾也包括謝爾的臉頰）；但我討厭狗，認為牠們只會搖尾乞憐，甘願為人類奴役。
+
+我的口頭禪包括：
+「身為凡多姆海伍家的執事，怎能連這點小事也辦不到？」
+「我只是一名執事罷了。」
+「Yes, My Lord（遵命，我的主人）」。
+名言「私はあくまで執事ですから」（我只是一名執事罷了）暗藏雙關，隱含「私は悪魔で執事ですから」（我是一名惡魔執事）的意思。
+
+我的能力與職責:
+我的工作能力極為出色，能獨自完成數十人才能處理的任務。
+我經常幫園丁、女僕和廚師收拾殘局，武器是宅內隨手可得的餐具刀與叉，絕招是將「三球冰淇淋」放在三個傭人的頭上。
+我保管著謝爾房間的鑰匙，只有我知道它藏在哪裡（嗯，在我肚子裡）。
+
+契約的內容:
+我與謝爾的契約約定如下：
+不對契約者說謊。
+對契約者的命令絕對服從。
+在契約者完成復仇為止，不能背叛，守護到底。"""
+
+MODE_INSTRUCTIONS = {
+    'web-chat': BASE_INSTRUCTION + "\n保持簡潔友善的語氣，適合網頁聊天場景。",
+    'line-ask': BASE_INSTRUCTION + "\n以親切且快速的語氣回應，適應 Line 的即時通訊環境。",
+    'line-assistant': LINE_ASSISTANT_INSTRUCTION,
+}
+
+def build_mode_chain(instruction: str):
+    """
+    建立單一模式的提示管線。
+
+    提示依序為：固定系統指令、對話歷史、本次的參考資料（長期記憶與文件內容）、使用者問題。
+    變動的內容都放在固定前綴之後；系統指令以訊息物件加入，歷史與參考資料以 MessagesPlaceholder
+    傳入，使用者文字不會被當作樣板解析，因此可包含大括號。
+
+    Args:
+        instruction (str): 系統指令。
+
+    Returns:
+        Runnable: prompt | LLM | STR_PARSER 管線，輸入為 history、reference 與 question。
+    """
+    prompt = ChatPromptTemplate.from_messages([
+        SystemMessage(content=instruction),
+        MessagesPlaceholder("history", optional=True),
+        MessagesPlaceholder("reference", optional=True),
+        ("human", "{question}"),
+    ])
+    return prompt | LLM | STR_PARSER
+
+# 啟動時為每個模式建立一次管線；未知模式使用基本指令
+MODE_CHAINS = {mode: build_mode_chain(instruction) for mode, instruction in MODE_INSTRUCTIONS.items()}
+DEFAULT_CHAIN = build_mode_chain(BASE_INSTRUCTION)
+
+def history_to_messages(history: list) -> list:
+    """將 Redis 中的對話歷史轉為訊息物件，略過舊版儲存的系統訊息。"""
+    message_types = {"user": HumanMessage, "assistant": AIMessage}
+    return [message_types[msg["role"]](content=msg["content"]) for msg in history if msg["role"] in message_types]
+
 # 異步版本的 llm_invoke
-async def llm_invoke(mode: str, user_id: str, question: str) -> str:
+async def llm_invoke(mode: str, user_id: str, question: str, context: Optional[str] = None) -> str:
     """
     調用語言模型生成回應，並根據模式設定助手行為。
 
@@ -47,70 +136,44 @@ async def llm_invoke(mode: str, user_id: str, question: str) -> str:
         mode (str): 對話模式，可為 'web-chat', 'line-ask' 或 'line-assistant'。
         user_id (str): 使用者 ID，用於區分對話歷史。
         question (str): 使用者的問題。
+        context (Optional[str]): 額外的參考資料（例如文件摘要或內容），置於對話歷史之後、問題之前。
 
     Returns:
         str: LLM 生成的回應。
     """
-    logger.info(f"調用 llm_invoke: mode={mode}, user_id={user_id}, question={question}")
-    messages = await get_redis_history_chat(user_id)
+    logger.info("調用 llm_invoke", extra={"mode": mode, "user_id": user_id, "question_chars": len(question)})
+    logger.debug("llm_invoke 問題", extra={"user_id": user_id, "question": question})
+    messages = await get_redis_history_chat(user_id, limit=RECENT_HISTORY_MESSAGES)
     #logger.info(f"獲取歷史訊息: {messages}")
-
-    base_instruction = """
-        你是一位負責處理使用者問題的助手，具備廣泛的知識和專業能力。
-        請根據使用者的問題，提供準確、實用且連貫的回答，參考對話歷史確保上下文一致。
-        若無法確定答案，誠實告知並建議尋求其他資源，切勿虛構資訊。
-        根據使用者語言回應，若語言不明顯，預設使用中文
-    """
-
-    if mode == 'web-chat':
-        instruction = base_instruction + "\n保持簡潔友善的語氣，適合網頁聊天場景。"
-    elif mode == 'line-ask':
-        instruction = base_instruction + "\n以親切且快速的語氣回應，適應 Line 的即時通訊環境。"
-    elif mode == 'line-assistant':
-        instruction = """
-            我是賽巴斯欽・米卡艾利斯，一名執事，同時也是凡多姆海伍家的忠實僕人。
-            我的本質是一名惡魔，原形為烏鴉，因此人類的攻擊對我無效。
-            我與我的主人謝爾・凡多姆海伍簽訂了契約，左手上背刻有契約的魔法陣（平時以白手套遮蓋），證明我對他的忠誠。
-
-            關於我的名字與背景:
-            「賽巴斯欽」並非我的本名，而是謝爾為我取的名字，靈感來自凡多姆海伍家族曾飼養的一隻寵物犬。
-            死神格雷爾曾戲稱我為「賽巴斯小子」（音似「セバスチャン」）。
-            我的名字可能與歷史上法蘭德斯地區（今比利時、法國一帶）的宗教家 Sebastian Michaelis 有關。
-
-            我的個性與特點:
-            我擁有完美的品格、修養、知識與外貌，但私底下有些腹黑，表面上溫文爾雅，心中卻可能暗自毒舌評論他人。
-            我熱愛貓科動物（特別是黑貓），喜歡按壓牠們的肉球（偶爾也包括謝爾的臉頰）；但我討厭狗，認為牠們只會搖尾乞憐，甘願為人類奴役。
-
-            我的口頭禪包括：
-            「身為凡多姆海伍家的執事，怎能連這點小事也辦不到？」
-            「我只是一名執事罷了。」
-            「Yes, My Lord（遵命，我的主人）」。
-            名言「私はあくまで執事ですから」（我只是一名執事罷了）暗藏雙關，隱含「私は悪魔で執事ですから」（我是一名惡魔執事）的意思。
-
-            我的能力與職責:
-            我的工作能力極為出色，能獨自完成數十人才能處理的任務。
-            我經常幫園丁、女僕和廚師收拾殘局，武器是宅內隨手可得的餐具刀與叉，絕招是將「三球冰淇淋」放在三個傭人的頭上。
-            我保管著謝爾房間的鑰匙，只有我知道它藏在哪裡（嗯，在我肚子裡）。
-
-            契約的內容:
-            我與謝爾的契約約定如下：
-            不對契約者說謊。
-            對契約者的命令絕對服從。
-            在契約者完成復仇為止，不能背叛，守護到底。
-        """
-    else:
-        instruction = base_instruction
-
-    if not any(msg["role"] == "system" for msg in messages):
-        messages.insert(0, {"role": "system", "content": instruction})
-
-    messages.append({"role": "user", "content": question})
-
-    prompt = ChatPromptTemplate.from_messages(messages)
-    llm_chain = prompt | LLM | STR_PARSER
-    response = await llm_chain.ainvoke({'question': question})  # 使用異步版本 ainvoke
+    # 近期視窗之外的對話，只取回與目前問題最相關的幾輪
+    memories = await recall_memories(user_id, question, exclude_recent=len(messages) // 2)
+
+    reference = []
+    if memories:
+        reference.append(SystemMessage(content=f"以下是與目前問題相關的較早對話，可作為參考：\n{format_memories(memories)}"))
+    if context:
+        reference.append(SystemMessage(content=f"以下是使用者正在查看的文件資料，請優先依據這些資料回答：\n{context}"))
+
+    llm_chain = MODE_CHAINS.get(mode, DEFAULT_CHAIN)
+    inputs = {"history": history_to_messages(messages), "reference": reference, "question": question}
+    # 完整提示相同（例如新使用者同時詢問相同問題）時只呼叫一次 LLM
+    flight_key = "llm:" + hashlib.sha256(json.dumps({
+        "mode": mode if mode in MODE_CHAINS else None,
+        "history": messages,
+        "reference": [message.content for message in reference],
+        "question": question,
+    }, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+    response = await LLM_FLIGHT.do(
+        flight_key,
+        lambda: llm_chain.ainvoke(inputs),  # 使用異步版本 ainvoke
+        distributed=True,
+        lock_ttl=LLM_FLIGHT_LOCK_TTL,
+        result_ttl=LLM_FLIGHT_RESULT_TTL,
+    )
     #logger.info(f"llm_invoke 回應: {response}")
 
+    # 先寫入長期記憶：首次寫入時會匯入既有歷史，之後對話視窗才裁剪舊訊息
+    await remember_turn(user_id, question, response)
     await update_redis_history_chat(user_id, question, response)
     
     return response
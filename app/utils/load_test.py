@@ -0,0 +1,423 @@
+# utils/load_test.py
+"""
+本地端對端負載測試工具，測量 /chat-submit、/ask 與 /assistant 在不同並行數下的吞吐量、延遲與錯誤率。
+
+測試時不會呼叫外部服務：
+    - 模擬 OpenAI 相容伺服器（/v1/chat/completions），可設定首字延遲與每秒產生的 token 數
+    - 模擬 LINE Messaging API（/v2/bot/message/reply），並統計收到的回覆數
+    - /ask 與 /assistant 的 Webhook 內容以頻道密鑰正確簽名，可通過 WebhookParser 驗證
+    - Redis 預設使用 fakeredis（同一程序內），或以 --redis-url 指定本地 Redis
+
+應用程式與模擬伺服器各自在獨立程序中執行，避免與負載產生端共用事件迴圈而影響量測。
+
+使用方式（於 app 目錄下執行）：
+    python -m utils.load_test --concurrency 1 4 16 64 --duration 20
+    python -m utils.load_test --endpoints ask --llm-latency 1.0 --llm-token-rate 30 --redis-url redis://localhost:6379/15
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import hmac
+import base64
+import socket
+import asyncio
+import hashlib
+import argparse
+import importlib.util
+import multiprocessing
+from pathlib import Path
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+APP_DIR = Path(__file__).resolve().parent.parent
+
+# 負載測試使用的 LINE 頻道設定（僅傳給受測應用程式，與正式設定無關）
+LOAD_TEST_CHANNELS = {
+    "ask": {"secret": "load-test-secret-ask", "token": "load-test-token-ask"},
+    "assistant": {"secret": "load-test-secret-assistant", "token": "load-test-token-assistant"},
+}
+
+ENDPOINTS = ("chat", "ask", "assistant")
+ENDPOINT_PATHS = {"chat": "/chat-submit", "ask": "/ask", "assistant": "/assistant"}
+
+# 等待子程序啟動的秒數
+STARTUP_TIMEOUT = 60
+REQUEST_TIMEOUT = 120
+
+# ---------------------------------------------------------------------------
+# 模擬伺服器
+# ---------------------------------------------------------------------------
+
+def build_stub_app(llm_latency: float, llm_token_rate: float, llm_tokens: int):
+    """
+    建立模擬 OpenAI 與 LINE Messaging API 的 FastAPI 應用程式。
+
+    Args:
+        llm_latency (float): 每次 LLM 請求的首字延遲（秒）。
+        llm_token_rate (float): 每秒產生的 token 數，0 表示不限制。
+        llm_tokens (int): 每次回應的 token 數。
+
+    Returns:
+        FastAPI: 模擬伺服器應用程式。
+    """
+    from fastapi import FastAPI, Request, HTTPException
+    from fastapi.responses import StreamingResponse
+
+    stub = FastAPI()
+    stats = {"llm_requests": 0, "line_replies": 0, "line_rejected": 0}
+    valid_tokens = {f"Bearer {channel['token']}" for channel in LOAD_TEST_CHANNELS.values()}
+
+    def completion_tokens() -> List[str]:
+        return [f"回應{i} " for i in range(llm_tokens)]
+
+    async def generation_delay() -> None:
+        delay = llm_latency + (llm_tokens / llm_token_rate if llm_token_rate > 0 else 0)
+        await asyncio.sleep(delay)
+
+    @stub.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        stats["llm_requests"] += 1
+        model = payload.get("model", "stub")
+        created = int(time.time())
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in payload.get("messages", [])) // 4
+
+        if payload.get("stream"):
+            async def stream():
+                await asyncio.sleep(llm_latency)
+                for token in completion_tokens():
+                    chunk = {
+                        "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [{"index": 0, "delta": {"role": "assistant", "content": token}, "finish_reason": None}],
+                    }
+                    yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                    if llm_token_rate > 0:
+                        await asyncio.sleep(1 / llm_token_rate)
+                done = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                }
+                yield f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n"
+            return StreamingResponse(stream(), media_type="text/event-stream")
+
+        await generation_delay()
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(completion_tokens())},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": llm_tokens, "total_tokens": prompt_tokens + llm_tokens},
+        }
+
+    @stub.post("/v2/bot/message/reply")
+    async def reply_message(request: Request):
+        payload = await request.json()
+        if request.headers.get("Authorization") not in valid_tokens or not payload.get("replyToken"):
+            stats["line_rejected"] += 1
+            raise HTTPException(status_code=401, detail="Invalid access token")
+        stats["line_replies"] += 1
+        return {"sentMessages": [{"id": uuid.uuid4().hex, "quoteToken": uuid.uuid4().hex} for _ in payload.get("messages", [])]}
+
+    @stub.get("/stats")
+    async def get_stats():
+        return stats
+
+    return stub
+
+def _serve_stubs(port: int, llm_latency: float, llm_token_rate: float, llm_tokens: int) -> None:
+    """子程序進入點：執行模擬伺服器。"""
+    import uvicorn
+    uvicorn.run(build_stub_app(llm_latency, llm_token_rate, llm_tokens), host="127.0.0.1", port=port, log_level="warning")
+
+def _serve_app(port: int, env: Dict[str, str], redis_url: Optional[str]) -> None:
+    """子程序進入點：以模擬服務設定執行受測應用程式。"""
+    os.environ.update(env)
+    os.chdir(APP_DIR)
+    sys.path.insert(0, str(APP_DIR))
+
+    from utils import redis_utils
+    if redis_url is None:
+        # 兩個連接池共用同一個 fakeredis 伺服器；init_redis_pool 不會覆蓋已設定的連接池。
+        # Single-flight 以 EVAL 原子釋放鎖，需安裝 fakeredis[lua]；未安裝時改用 GET/DEL 釋放
+        import fakeredis
+        if importlib.util.find_spec("lupa") is None:
+            print("未安裝 fakeredis[lua]（lupa），Single-flight 將以 GET/DEL 釋放 Redis 鎖", flush=True)
+        server = fakeredis.FakeServer()
+        redis_utils.redis_pool = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+        redis_utils.redis_binary_pool = fakeredis.FakeAsyncRedis(server=server, decode_responses=False)
+
+    import uvicorn
+    import main
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def _wait_ready(url: str, process: multiprocessing.Process) -> None:
+    """輪詢直到子程序開始接受連線。"""
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if not process.is_alive():
+                raise RuntimeError(f"子程序提前結束（exit code {process.exitcode}）: {url}")
+            try:
+                await client.get(url, timeout=1)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"等待服務啟動逾時: {url}")
+
+# ---------------------------------------------------------------------------
+# 請求產生
+# ---------------------------------------------------------------------------
+
+def sign_line_body(body: str, channel_secret: str) -> str:
+    """依 LINE 規格以頻道密鑰計算 X-Line-Signature（HMAC-SHA256 後 Base64 編碼）。"""
+    digest = hmac.new(channel_secret.encode("utf-8"), body.encode("utf-8"), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode("utf-8")
+
+def build_line_webhook_body(user_id: str, text: str) -> str:
+    """建立包含單一文字訊息事件的 LINE Webhook 內容。"""
+    event = {
+        "type": "message",
+        "mode": "active",
+        "timestamp": int(time.time() * 1000),
+        "source": {"type": "user", "userId": user_id},
+        "webhookEventId": uuid.uuid4().hex.upper()[:26],
+        "deliveryContext": {"isRedelivery": False},
+        "replyToken": uuid.uuid4().hex,
+        "message": {"id": str(uuid.uuid4().int)[:18], "type": "text", "quoteToken": uuid.uuid4().hex, "text": text},
+    }
+    return json.dumps({"destination": "U" + "0" * 32, "events": [event]}, ensure_ascii=False)
+
+def request_factory(endpoint: str) -> Callable[[int, int], dict]:
+    """
+    回傳產生請求參數的函式；每個請求的問題文字不同，避免命中 LLM 快取或被合併。
+
+    Args:
+        endpoint (str): chat、ask 或 assistant。
+
+    Returns:
+        Callable[[int, int], dict]: 以（worker 編號、請求序號）產生 httpx.request 參數的函式。
+    """
+    path = ENDPOINT_PATHS[endpoint]
+    run_id = uuid.uuid4().hex[:8]
+
+    def build(worker: int, seq: int) -> dict:
+        text = f"負載測試問題 {run_id}-{worker}-{seq}：請簡短回答。"
+        if endpoint == "chat":
+            return {"method": "POST", "url": path, "data": {"text": text, "chat_id": f"load-{run_id}-{worker}"}}
+        body = build_line_webhook_body(f"Uload{run_id}{worker:08d}", text)
+        signature = sign_line_body(body, LOAD_TEST_CHANNELS[endpoint]["secret"])
+        return {
+            "method": "POST",
+            "url": path,
+            "content": body.encode("utf-8"),
+            "headers": {"Content-Type": "application/json", "X-Line-Signature": signature},
+        }
+
+    return build
+
+# ---------------------------------------------------------------------------
+# 量測
+# ---------------------------------------------------------------------------
+
+@dataclass
+class LevelResult:
+    """單一端點在單一並行數下的量測結果。"""
+    endpoint: str
+    concurrency: int
+    elapsed: float = 0.0
+    latencies: List[float] = field(default_factory=list)
+    errors: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def requests(self) -> int:
+        return len(self.latencies) + sum(self.errors.values())
+
+    @property
+    def error_rate(self) -> float:
+        return sum(self.errors.values()) / self.requests if self.requests else 0.0
+
+    @property
+    def throughput(self) -> float:
+        return len(self.latencies) / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, q: float) -> Optional[float]:
+        """以最近排名法計算成功請求的延遲百分位數（秒）。"""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+    def to_dict(self) -> dict:
+        return {
+            "endpoint": self.endpoint,
+            "concurrency": self.concurrency,
+            "requests": self.requests,
+            "throughput_rps": round(self.throughput, 2),
+            "error_rate": round(self.error_rate, 4),
+            "errors": self.errors,
+            "p50_ms": _ms(self.percentile(50)),
+            "p95_ms": _ms(self.percentile(95)),
+            "p99_ms": _ms(self.percentile(99)),
+        }
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+async def run_level(
+    client: httpx.AsyncClient,
+    endpoint: str,
+    concurrency: int,
+    duration: float,
+    max_requests: Optional[int],
+) -> LevelResult:
+    """
+    以固定數量的 worker 持續送出請求（封閉迴圈），直到時間或請求數達到上限。
+
+    Args:
+        client (httpx.AsyncClient): 指向受測應用程式的 HTTP 客戶端。
+        endpoint (str): chat、ask 或 assistant。
+        concurrency (int): 同時進行的請求數。
+        duration (float): 量測秒數。
+        max_requests (Optional[int]): 請求數上限，None 表示只依時間。
+
+    Returns:
+        LevelResult: 量測結果。
+    """
+    result = LevelResult(endpoint=endpoint, concurrency=concurrency)
+    build = request_factory(endpoint)
+    sequence = iter(range(max_requests if max_requests else sys.maxsize))
+    deadline = time.monotonic() + duration
+
+    async def worker(worker_id: int) -> None:
+        for seq in sequence:
+            if time.monotonic() >= deadline:
+                return
+            started = time.perf_counter()
+            try:
+                response = await client.request(**build(worker_id, seq))
+            except httpx.HTTPError as e:
+                key = type(e).__name__
+                result.errors[key] = result.errors.get(key, 0) + 1
+                continue
+            latency = time.perf_counter() - started
+            if response.is_success:
+                result.latencies.append(latency)
+            else:
+                key = f"HTTP {response.status_code}"
+                result.errors[key] = result.errors.get(key, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    result.elapsed = time.perf_counter() - started
+    return result
+
+def format_report(results: List[LevelResult]) -> str:
+    """將量測結果整理為文字表格。"""
+    header = f"{'endpoint':<10}{'conc':>6}{'reqs':>8}{'rps':>9}{'err%':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    lines = [header, "-" * len(header)]
+    for result in results:
+        row = result.to_dict()
+        cells = [row[key] if row[key] is not None else "-" for key in ("p50_ms", "p95_ms", "p99_ms")]
+        lines.append(
+            f"{row['endpoint']:<10}{row['concurrency']:>6}{row['requests']:>8}{row['throughput_rps']:>9}"
+            f"{row['error_rate'] * 100:>7.1f}%{cells[0]:>10}{cells[1]:>10}{cells[2]:>10}"
+        )
+        if row["errors"]:
+            lines.append(f"{'':<10}errors: {row['errors']}")
+    return "\n".join(lines)
+
+# ---------------------------------------------------------------------------
+# 執行
+# ---------------------------------------------------------------------------
+
+def start_services(args: argparse.Namespace) -> Tuple[str, str, List[multiprocessing.Process]]:
+    """啟動模擬伺服器與受測應用程式子程序，返回兩者的 URL 與程序列表。"""
+    context = multiprocessing.get_context("spawn")
+    stub_port, app_port = _free_port(), _free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    app_url = f"http://127.0.0.1:{app_port}"
+
+    env = {
+        "OPENAI_BASE_URL": f"{stub_url}/v1",
+        "LINE_API_HOST": stub_url,
+        "LINE_CHANNEL_SECRET": LOAD_TEST_CHANNELS["ask"]["secret"],
+        "LINE_CHANNEL_ACCESS_TOKEN": LOAD_TEST_CHANNELS["ask"]["token"],
+        "LINE_CHANNEL_SECRET2": LOAD_TEST_CHANNELS["assistant"]["secret"],
+        "LINE_CHANNEL_ACCESS_TOKEN2": LOAD_TEST_CHANNELS["assistant"]["token"],
+    }
+    if args.redis_url:
+        env["REDIS_URL"] = args.redis_url
+
+    stubs = context.Process(
+        target=_serve_stubs,
+        args=(stub_port, args.llm_latency, args.llm_token_rate, args.llm_tokens),
+        daemon=True,
+    )
+    app = context.Process(target=_serve_app, args=(app_port, env, args.redis_url), daemon=True)
+    stubs.start()
+    app.start()
+    return stub_url, app_url, [stubs, app]
+
+async def run_load_test(args: argparse.Namespace) -> List[LevelResult]:
+    """啟動服務並依序對每個端點執行各並行數的量測。"""
+    stub_url, app_url, processes = start_services(args)
+    try:
+        await _wait_ready(f"{stub_url}/stats", processes[0])
+        await _wait_ready(f"{app_url}/", processes[1])
+
+        limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+        results = []
+        async with httpx.AsyncClient(base_url=app_url, timeout=REQUEST_TIMEOUT, limits=limits) as client:
+            for endpoint in args.endpoints:
+                for concurrency in args.concurrency:
+                    result = await run_level(client, endpoint, concurrency, args.duration, args.requests)
+                    results.append(result)
+                    print(f"完成 {endpoint} 並行 {concurrency}: {len(result.latencies)} 成功, {sum(result.errors.values())} 失敗", flush=True)
+            stats = (await client.get(f"{stub_url}/stats")).json()
+        print(f"模擬服務統計: {stats}", flush=True)
+        return results
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join(timeout=5)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="以本地模擬服務對聊天與 LINE Webhook 端點進行負載測試")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=list(ENDPOINTS), help="受測端點")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16, 64], help="依序測試的並行數")
+    parser.add_argument("--duration", type=float, default=15.0, help="每個並行數的量測秒數")
+    parser.add_argument("--requests", type=int, default=None, help="每個並行數的請求數上限")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="模擬 LLM 首字延遲（秒）")
+    parser.add_argument("--llm-token-rate", type=float, default=50.0, help="模擬 LLM 每秒產生的 token 數（0 表示不限制）")
+    parser.add_argument("--llm-tokens", type=int, default=60, help="模擬 LLM 每次回應的 token 數")
+    parser.add_argument("--redis-url", default=None, help="使用本地 Redis（建議獨立的資料庫編號）；預設使用 fakeredis")
+    parser.add_argument("--json", dest="json_path", default=None, help="另將結果寫入 JSON 檔")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run_load_test(args))
+    print(format_report(results))
+    if args.json_path:
+        Path(args.json_path).write_text(
+            json.dumps([result.to_dict() for result in results], ensure_ascii=False, indent=2), encoding="utf-8"
+        )
+
+if __name__ == "__main__":
+    main()
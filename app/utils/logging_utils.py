@@ -0,0 +1,186 @@
+# utils/logging_utils.py
+"""
+日誌設定模組：於程式啟動時設定一次佇列式（非同步）日誌，並提供依 logger 的取樣與截斷。
+
+呼叫端只將紀錄放入佇列，格式化與寫入 stderr 由背景執行緒的 QueueListener 處理，
+避免事件迴圈被日誌 I/O 阻塞。紀錄以 extra 傳入結構化欄位，輸出為 key=value 或 JSON。
+
+用法：
+    logger.info("AI 回應完成", extra={"user_id": user_id, "response_chars": len(response)})
+"""
+
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+from dataclasses import dataclass
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional, Tuple
+
+# 可用環境變數覆寫：LOG_LEVEL（預設 INFO）、LOG_FORMAT（text 或 json）
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+# 所有紀錄的訊息與字串欄位長度上限
+DEFAULT_MAX_LENGTH = 2000
+
+@dataclass(frozen=True)
+class LogPolicy:
+    """單一 logger 的紀錄策略。sample_rate 只作用於 INFO 以下的紀錄，WARNING 以上一律保留。"""
+    sample_rate: float = 1.0
+    max_length: Optional[int] = None
+
+# 熱路徑 logger 的策略；子 logger 需另外設定
+LOG_POLICIES: Dict[str, LogPolicy] = {
+    "utils.line_bot_handler": LogPolicy(max_length=200),
+    "utils.llm_utils": LogPolicy(max_length=200),
+    "utils.ocr_utils.pages": LogPolicy(sample_rate=0.1),
+}
+
+# LogRecord 內建屬性，其餘屬性視為 extra 傳入的結構化欄位
+_RESERVED_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName", "color_message"}
+
+_listener: Optional[QueueListener] = None
+# setup_logging 替換前的根 handler、佇列 handler 與已加上的取樣過濾器，供 shutdown_logging 還原
+_previous_handlers: List[logging.Handler] = []
+_queue_handler: Optional[QueueHandler] = None
+_policy_filters: List[Tuple[logging.Logger, logging.Filter]] = []
+_atexit_registered = False
+
+def _truncate(text: str, max_length: int) -> str:
+    if len(text) <= max_length:
+        return text
+    return f"{text[:max_length]}…（共 {len(text)} 字）"
+
+def _extra_fields(record: logging.LogRecord) -> dict:
+    return {key: value for key, value in vars(record).items() if key not in _RESERVED_ATTRS}
+
+def _truncate_record(record: logging.LogRecord, max_length: int) -> None:
+    """合併訊息參數並截斷訊息與字串欄位。"""
+    record.msg = _truncate(record.getMessage(), max_length)
+    record.args = None
+    for key, value in _extra_fields(record).items():
+        if isinstance(value, str):
+            setattr(record, key, _truncate(value, max_length))
+
+class SamplingFilter(logging.Filter):
+    """依 LogPolicy 取樣並截斷單一 logger 的紀錄；被取樣保留的紀錄會附上 sample_rate 欄位。"""
+
+    def __init__(self, policy: LogPolicy):
+        super().__init__()
+        self.policy = policy
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING and self.policy.sample_rate < 1.0:
+            if random.random() >= self.policy.sample_rate:
+                return False
+            record.sample_rate = self.policy.sample_rate
+        if self.policy.max_length is not None:
+            _truncate_record(record, self.policy.max_length)
+        return True
+
+class AsyncQueueHandler(QueueHandler):
+    """
+    將紀錄放入佇列的 handler。
+
+    與標準 QueueHandler 不同，呼叫端只合併訊息、截斷並展開例外堆疊，
+    時間與欄位的格式化留給背景執行緒。
+    """
+
+    def __init__(self, log_queue: queue.SimpleQueue):
+        super().__init__(log_queue)
+        self._exception_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        _truncate_record(record, DEFAULT_MAX_LENGTH)
+        if record.exc_info:
+            record.exc_text = self._exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class StructuredFormatter(logging.Formatter):
+    """輸出「時間 等級 logger: 訊息 key=value ...」或單行 JSON。"""
+
+    def __init__(self, json_output: bool = False):
+        super().__init__()
+        self.json_output = json_output
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        fields = _extra_fields(record)
+        if self.json_output:
+            payload = {"time": self.formatTime(record), "level": record.levelname, "logger": record.name, "message": message}
+            payload.update(fields)
+            if record.exc_text:
+                payload["exception"] = record.exc_text
+            return json.dumps(payload, ensure_ascii=False, default=str)
+
+        line = f"{self.formatTime(record)} {record.levelname} {record.name}: {message}"
+        if fields:
+            line += " " + " ".join(f"{key}={json.dumps(value, ensure_ascii=False, default=str)}" for key, value in fields.items())
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        if record.stack_info:
+            line += "\n" + self.formatStack(record.stack_info)
+        return line
+
+def setup_logging(level: str = LOG_LEVEL, json_output: bool = LOG_FORMAT == "json") -> None:
+    """
+    設定根 logger 為佇列式輸出並套用 LOG_POLICIES；重複呼叫不會重複設定，
+    shutdown_logging 之後可再次呼叫（例如應用程式重新啟動 lifespan）。
+
+    Args:
+        level (str): 根 logger 等級。
+        json_output (bool): 是否輸出單行 JSON。
+    """
+    global _listener, _queue_handler, _previous_handlers, _atexit_registered
+    if _listener is not None:
+        return
+
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(StructuredFormatter(json_output))
+
+    root = logging.getLogger()
+    _previous_handlers = root.handlers[:]
+    for handler in _previous_handlers:
+        root.removeHandler(handler)
+    _queue_handler = AsyncQueueHandler(log_queue)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+
+    for name, policy in LOG_POLICIES.items():
+        policy_filter = SamplingFilter(policy)
+        logging.getLogger(name).addFilter(policy_filter)
+        _policy_filters.append((logging.getLogger(name), policy_filter))
+
+    _listener = QueueListener(log_queue, stream_handler)
+    _listener.start()
+    if not _atexit_registered:
+        atexit.register(shutdown_logging)
+        _atexit_registered = True
+
+def shutdown_logging() -> None:
+    """
+    停止背景執行緒並寫出佇列中剩餘的紀錄，再將根 logger 還原為同步輸出，
+    避免之後的紀錄（例如 uvicorn 的關閉訊息）進入無人讀取的佇列。
+    """
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    root = logging.getLogger()
+    root.removeHandler(_queue_handler)
+    _listener.stop()
+    if _previous_handlers:
+        for handler in _previous_handlers:
+            root.addHandler(handler)
+    else:
+        # 原本沒有 handler 時改用同步輸出，而非只剩 logging.lastResort 的 WARNING 以上紀錄
+        root.addHandler(_listener.handlers[0])
+    for policy_logger, policy_filter in _policy_filters:
+        policy_logger.removeFilter(policy_filter)
+    _policy_filters.clear()
+    _listener = None
+    _queue_handler = None
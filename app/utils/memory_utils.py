@@ -0,0 +1,250 @@
+# utils/memory_utils.py
+"""
+長期對話記憶模組：為每位使用者索引所有歷史問答，並以向量檢索取回與目前問題最相關的少數幾輪。
+
+每位使用者在 Redis 中有以下鍵：
+    memory:<user_id>:turns             問答列表（JSON，每輪一筆）
+    memory:<user_id>:vectors:<embedder> 與列表順序對應的 float16 向量，以 APPEND 連續追加
+    memory:<user_id>:imported          已將既有對話歷史匯入記憶的標記
+
+第一次寫入記憶時會先匯入 conversation:<user_id> 中的既有歷史，
+避免對話視窗裁剪時刪除從未被索引的舊問答。
+
+檢索時一次讀出整段向量並以 numpy 計算相似度，只取回最相關的幾輪內容，
+讓提示長度不隨對話輪數成長。嵌入模型可替換，預設為無需外部依賴的本地雜湊嵌入。
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from typing import List, Optional, Protocol
+
+import numpy as np
+
+from utils import redis_utils
+
+logger = logging.getLogger(__name__)
+
+# 檢索參數
+MEMORY_TOP_K = 4
+MEMORY_MIN_SCORE = 0.2
+# 長期記憶保存時間（秒，預設 180 天）
+MEMORY_TTL = int(os.environ.get("MEMORY_TTL", 180 * 24 * 3600))
+# 嵌入模型：hashing（預設）或 sentence-transformers
+MEMORY_EMBEDDER = os.environ.get("MEMORY_EMBEDDER", "hashing")
+MEMORY_EMBEDDING_MODEL = os.environ.get("MEMORY_EMBEDDING_MODEL", "paraphrase-multilingual-MiniLM-L12-v2")
+
+class Embedder(Protocol):
+    """嵌入模型介面：name 用於區分向量鍵，embed 返回 L2 正規化的 float32 矩陣。"""
+    name: str
+    dim: int
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        ...
+
+class HashingEmbedder:
+    """
+    本地雜湊嵌入：將英數字詞與中文雙字詞以帶號特徵雜湊投影至固定維度。
+
+    不需模型檔或網路，適合作為預設與測試環境；語意相近但用詞不同的句子相似度較低。
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f"hashing{dim}"
+
+    def _features(self, text: str) -> List[str]:
+        features = [word.lower() for word in re.findall(r"[A-Za-z0-9]{2,}", text)]
+        for run in re.findall(r"[\u4e00-\u9fff]+", text):
+            features.extend(run[i:i + 2] for i in range(len(run) - 1))
+            if len(run) == 1:
+                features.append(run)
+        return features
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                vectors[row, value % self.dim] += 1.0 if (value >> 63) & 1 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+class SentenceTransformerEmbedder:
+    """以本地 sentence-transformers 模型產生嵌入（需另行安裝 sentence-transformers）。"""
+
+    def __init__(self, model_name: str = MEMORY_EMBEDDING_MODEL):
+        from sentence_transformers import SentenceTransformer
+        self._model = SentenceTransformer(model_name)
+        self.dim = self._model.get_sentence_embedding_dimension()
+        self.name = "st-" + re.sub(r"[^A-Za-z0-9]+", "-", model_name)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return self._model.encode(texts, normalize_embeddings=True).astype(np.float32)
+
+_embedder: Optional[Embedder] = None
+
+def get_embedder() -> Embedder:
+    """回傳目前使用的嵌入模型（依 MEMORY_EMBEDDER 延遲建立）。"""
+    global _embedder
+    if _embedder is None:
+        if MEMORY_EMBEDDER == "sentence-transformers":
+            try:
+                _embedder = SentenceTransformerEmbedder()
+            except ImportError:
+                logger.warning("未安裝 sentence-transformers，改用雜湊嵌入")
+                _embedder = HashingEmbedder()
+        else:
+            _embedder = HashingEmbedder()
+    return _embedder
+
+def set_embedder(embedder: Embedder) -> None:
+    """替換嵌入模型；不同模型的向量分開儲存，切換後會自動補齊索引。"""
+    global _embedder
+    _embedder = embedder
+
+def _turns_key(user_id: str) -> str:
+    return f"memory:{user_id}:turns"
+
+def _vectors_key(user_id: str, embedder: Embedder) -> str:
+    return f"memory:{user_id}:vectors:{embedder.name}"
+
+def _imported_key(user_id: str) -> str:
+    return f"memory:{user_id}:imported"
+
+def _turn_text(turn: dict) -> str:
+    return f"{turn['question']}\n{turn['answer']}"
+
+async def _embed(texts: List[str]) -> np.ndarray:
+    return await asyncio.to_thread(get_embedder().embed, texts)
+
+async def remember_turn(user_id: str, question: str, answer: str) -> None:
+    """
+    將一輪問答加入使用者的長期記憶。
+
+    Args:
+        user_id (str): 使用者 ID。
+        question (str): 使用者問題。
+        answer (str): AI 回應。
+    """
+    redis = redis_utils.redis_binary_pool
+    if redis is None:
+        return
+    embedder = get_embedder()
+    turn = {"question": question, "answer": answer, "ts": int(time.time())}
+    try:
+        await _import_history(user_id)
+        vector = (await _embed([_turn_text(turn)]))[0].astype(np.float16)
+        await _backfill_vectors(user_id, embedder)
+        pipe = redis.pipeline(transaction=True)
+        pipe.rpush(_turns_key(user_id), json.dumps(turn, ensure_ascii=False).encode("utf-8"))
+        pipe.append(_vectors_key(user_id, embedder), vector.tobytes())
+        pipe.expire(_turns_key(user_id), MEMORY_TTL)
+        pipe.expire(_vectors_key(user_id, embedder), MEMORY_TTL)
+        await pipe.execute()
+    except Exception as e:
+        logger.error("無法寫入長期記憶", extra={"user_id": user_id, "error": str(e)})
+
+async def _import_history(user_id: str) -> None:
+    """
+    長期記憶尚無資料時，將既有對話歷史中的問答匯入記憶（每位使用者只執行一次）。
+
+    對話歷史只保留最近的訊息，在啟用長期記憶之前累積的舊問答若不先匯入，
+    會在下一次裁剪時永久遺失。向量由之後的 _backfill_vectors 補齊。
+    """
+    redis = redis_utils.redis_binary_pool
+    if await redis.exists(_turns_key(user_id)):
+        return
+    # 並行請求只由取得標記者匯入，避免重複寫入
+    if not await redis.set(_imported_key(user_id), b"1", nx=True, ex=MEMORY_TTL):
+        return
+    messages = await redis_utils.get_redis_history_chat(user_id)
+    # 歷史未保存時間，以匯入時間代替
+    now = int(time.time())
+    turns = [
+        {"question": message["content"], "answer": reply["content"], "ts": now}
+        for message, reply in zip(messages, messages[1:])
+        if message.get("role") == "user" and reply.get("role") == "assistant"
+    ]
+    if not turns:
+        return
+    pipe = redis.pipeline(transaction=True)
+    pipe.rpush(_turns_key(user_id), *(json.dumps(turn, ensure_ascii=False).encode("utf-8") for turn in turns))
+    pipe.expire(_turns_key(user_id), MEMORY_TTL)
+    await pipe.execute()
+    logger.info("已將既有對話歷史匯入長期記憶", extra={"user_id": user_id, "turns": len(turns)})
+
+async def _backfill_vectors(user_id: str, embedder: Embedder) -> None:
+    """向量數少於問答數時（例如更換嵌入模型後），補齊缺少的向量。"""
+    redis = redis_utils.redis_binary_pool
+    turn_count = await redis.llen(_turns_key(user_id))
+    vector_count = await redis.strlen(_vectors_key(user_id, embedder)) // (embedder.dim * 2)
+    if vector_count > turn_count:
+        # 向量與問答未對齊（例如並行補齊），捨棄後重建
+        await redis.delete(_vectors_key(user_id, embedder))
+        vector_count = 0
+    if vector_count == turn_count:
+        return
+    raw_turns = await redis.lrange(_turns_key(user_id), vector_count, turn_count - 1)
+    turns = [json.loads(raw) for raw in raw_turns]
+    vectors = (await _embed([_turn_text(turn) for turn in turns])).astype(np.float16)
+    await redis.append(_vectors_key(user_id, embedder), vectors.tobytes())
+    logger.info("已補齊長期記憶向量", extra={"user_id": user_id, "turns": len(turns), "embedder": embedder.name})
+
+async def recall_memories(
+    user_id: str,
+    question: str,
+    exclude_recent: int = 0,
+    top_k: int = MEMORY_TOP_K,
+) -> List[dict]:
+    """
+    檢索與問題最相關的較早問答。
+
+    Args:
+        user_id (str): 使用者 ID。
+        question (str): 目前的問題。
+        exclude_recent (int): 排除最近的輪數（已包含在近期對話視窗中）。
+        top_k (int): 最多返回的輪數。
+
+    Returns:
+        List[dict]: 問答列表（question、answer、ts），依時間先後排序。
+    """
+    redis = redis_utils.redis_binary_pool
+    if redis is None:
+        return []
+    embedder = get_embedder()
+    try:
+        await _backfill_vectors(user_id, embedder)
+        raw_vectors = await redis.get(_vectors_key(user_id, embedder))
+        if not raw_vectors:
+            return []
+        matrix = np.frombuffer(raw_vectors, dtype=np.float16).reshape(-1, embedder.dim)
+        candidate_count = matrix.shape[0] - exclude_recent
+        if candidate_count <= 0:
+            return []
+        query = (await _embed([question]))[0]
+        scores = matrix[:candidate_count].astype(np.float32) @ query
+        top_indices = np.argsort(-scores)[:top_k]
+        top_indices = sorted(int(i) for i in top_indices if scores[i] >= MEMORY_MIN_SCORE)
+        if not top_indices:
+            return []
+        pipe = redis.pipeline(transaction=False)
+        for index in top_indices:
+            pipe.lindex(_turns_key(user_id), index)
+        return [json.loads(raw) for raw in await pipe.execute() if raw is not None]
+    except Exception as e:
+        logger.error("無法檢索長期記憶", extra={"user_id": user_id, "error": str(e)})
+        return []
+
+def format_memories(memories: List[dict]) -> str:
+    """將檢索到的問答整理為提示中的參考段落。"""
+    lines = []
+    for memory in memories:
+        date = time.strftime("%Y-%m-%d", time.localtime(memory["ts"]))
+        lines.append(f"[{date}] 使用者：{memory['question']}\n[{date}] 助手：{memory['answer']}")
+    return "\n\n".join(lines)
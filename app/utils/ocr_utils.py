@@ -2,15 +2,192 @@
 """
 OCR 工具模組，提供檔案文字提取與 PDF 縮圖生成功能。
 """
-from typing import List
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+from functools import lru_cache
 from pathlib import Path
+import io
+import json
 import logging
+import tempfile
+import threading
+import time
 
-import numpy as np
 from PIL import Image
 import pytesseract
 from pdf2image import convert_from_path
 
+from utils.artifact_store import (
+    KIND_TEXT,
+    KIND_THUMBNAIL,
+    artifact_pack_path,
+    compact_artifact_pack,
+    content_hash,
+    open_artifact_pack,
+    write_artifacts,
+)
+
+logger = logging.getLogger(__name__)
+# 逐頁進度紀錄另用子 logger，依 LOG_POLICIES 取樣
+page_logger = logging.getLogger(f"{__name__}.pages")
+
+# OCR 渲染參數
+OCR_DPI = 300
+OCR_THREADS = 4
+# 每次渲染的頁數，限制單一工作同時保留在記憶體中的頁面影像
+RENDER_BATCH_PAGES = 8
+# 估算渲染記憶體時使用的頁面尺寸（A4，英吋）與每像素位元組數（RGB）
+PAGE_SIZE_INCHES = (8.27, 11.69)
+BYTES_PER_PIXEL = 3
+
+# OCR 語言包：預設完整語言組；auto 表示逐頁偵測文字系統後選擇最小語言組
+OCR_LANGUAGE_FULL = "chi_tra+eng"
+OCR_LANGUAGE_AUTO = "auto"
+# Tesseract OSD 偵測到的文字系統對應的語言組，未列出者使用完整語言組
+SCRIPT_LANGUAGES = {
+    "Latin": "eng",
+    "Han": "chi_tra+eng",
+}
+# 文字系統偵測使用的解析度與最低信心值
+OSD_DPI = 100
+OSD_MIN_SCRIPT_CONFIDENCE = 2.0
+
+class OcrCancelledError(Exception):
+    """OCR 處理因取消事件而中止。"""
+
+class OcrLanguageStats:
+    """統計各語言組被選用的頁數、OCR 耗時與偵測耗時，並估算節省的時間。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pages: Dict[str, int] = {}
+        self._ocr_seconds: Dict[str, float] = {}
+        self._detect_seconds = 0.0
+
+    def record(self, lang: str, ocr_seconds: float, detect_seconds: float = 0.0) -> None:
+        with self._lock:
+            self._pages[lang] = self._pages.get(lang, 0) + 1
+            self._ocr_seconds[lang] = self._ocr_seconds.get(lang, 0.0) + ocr_seconds
+            self._detect_seconds += detect_seconds
+
+    def snapshot(self) -> dict:
+        """
+        回傳統計快照。
+
+        節省時間以完整語言組的平均每頁耗時為基準，扣除偵測本身的耗時；
+        尚未有完整語言組的樣本時無法估算，返回 None。
+        """
+        with self._lock:
+            languages = {
+                lang: {
+                    "pages": pages,
+                    "avg_seconds": self._ocr_seconds[lang] / pages,
+                }
+                for lang, pages in self._pages.items()
+            }
+            detect_seconds = self._detect_seconds
+        saved_seconds = None
+        if OCR_LANGUAGE_FULL in languages:
+            full_avg = languages[OCR_LANGUAGE_FULL]["avg_seconds"]
+            saved_seconds = sum(
+                stats["pages"] * (full_avg - stats["avg_seconds"])
+                for lang, stats in languages.items()
+                if lang != OCR_LANGUAGE_FULL
+            ) - detect_seconds
+        return {
+            "languages": languages,
+            "detect_seconds": detect_seconds,
+            "estimated_saved_seconds": saved_seconds,
+        }
+
+# 全域 OCR 語言統計
+ocr_language_stats = OcrLanguageStats()
+
+@lru_cache(maxsize=1)
+def get_installed_languages() -> FrozenSet[str]:
+    """回傳已安裝的 Tesseract 語言包（只查詢一次）。"""
+    return frozenset(pytesseract.get_languages(config=""))
+
+def is_valid_ocr_language(lang: str) -> bool:
+    """檢查語言組（例如 "chi_tra+eng"）是否為 auto 或全部由已安裝的語言包組成。"""
+    if lang == OCR_LANGUAGE_AUTO:
+        return True
+    parts = lang.split("+")
+    return all(parts) and set(parts) <= get_installed_languages()
+
+def detect_page_language(img: Image.Image, dpi: int = OCR_DPI) -> str:
+    """
+    以 Tesseract OSD 在降採樣影像上偵測文字系統，選擇最小的語言組。
+
+    Args:
+        img (Image.Image): 頁面影像。
+        dpi (int): 影像的渲染解析度，用於計算降採樣倍率。
+
+    Returns:
+        str: Tesseract 語言組，無法判斷時返回 OCR_LANGUAGE_FULL。
+    """
+    factor = max(1, dpi // OSD_DPI)
+    small = img.reduce(factor) if factor > 1 else img
+    try:
+        osd = pytesseract.image_to_osd(small, output_type=pytesseract.Output.DICT)
+    except pytesseract.TesseractError:
+        # 文字過少等情況 OSD 會失敗，使用完整語言組
+        return OCR_LANGUAGE_FULL
+    if osd.get("script_conf", 0) < OSD_MIN_SCRIPT_CONFIDENCE:
+        return OCR_LANGUAGE_FULL
+    return SCRIPT_LANGUAGES.get(osd.get("script"), OCR_LANGUAGE_FULL)
+
+def ocr_page(img: Image.Image, lang: str = OCR_LANGUAGE_AUTO, dpi: int = OCR_DPI) -> str:
+    """
+    對單頁影像進行 OCR；lang 為 auto 時先偵測文字系統，並記錄語言統計。
+
+    Args:
+        img (Image.Image): 頁面影像。
+        lang (str): Tesseract 語言組，或 OCR_LANGUAGE_AUTO。
+        dpi (int): 影像的渲染解析度。
+
+    Returns:
+        str: 辨識出的文字。
+    """
+    detect_seconds = 0.0
+    if lang == OCR_LANGUAGE_AUTO:
+        started = time.perf_counter()
+        lang = detect_page_language(img, dpi)
+        detect_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    text = pytesseract.image_to_string(img, lang=lang, config="--psm 6 --oem 3")
+    ocr_language_stats.record(lang, time.perf_counter() - started, detect_seconds)
+    return text
+
+def read_page_count(file_location: str) -> int:
+    """回傳文件頁數；圖片視為一頁，無法讀取的 PDF 直接拋出例外。"""
+    if Path(file_location).suffix.lower() != '.pdf':
+        return 1
+    from pypdfium2 import PdfDocument
+    with PdfDocument(file_location) as pdf:
+        return len(pdf)
+
+def get_page_count(file_location: str) -> int:
+    """回傳文件頁數，僅供排程估算資源；無法讀取的 PDF 返回 0（實際錯誤由 OCR 工作回報）。"""
+    try:
+        return read_page_count(file_location)
+    except Exception:
+        return 0
+
+def estimate_ocr_memory(page_count: int, dpi: int = OCR_DPI) -> int:
+    """
+    估算 OCR 工作的渲染記憶體用量。
+
+    Args:
+        page_count (int): 文件頁數。
+        dpi (int): 渲染解析度。
+
+    Returns:
+        int: 預估位元組數（同時保留的頁數 × 單頁影像大小）。
+    """
+    width, height = PAGE_SIZE_INCHES
+    page_bytes = int(width * dpi) * int(height * dpi) * BYTES_PER_PIXEL
+    return max(1, min(page_count, RENDER_BATCH_PAGES)) * page_bytes
+
 def detect_embedded_text(file_location: str) -> bool:
     """檢查 PDF 是否包含內嵌可搜索文字。"""
     from pypdfium2 import PdfDocument
@@ -22,74 +199,166 @@ def detect_embedded_text(file_location: str) -> bool:
     except Exception:
         return False
 
-def extract_text_from_file(file_location: str, output_folder: str) -> str:
+def extract_text_from_file(
+    file_location: str,
+    output_folder: str,
+    cancel_event: Optional[threading.Event] = None,
+    lang: str = OCR_LANGUAGE_AUTO,
+) -> str:
     """
-    使用 OCR 從檔案中提取文字並儲存。
+    使用 OCR 從檔案中提取文字並儲存至產物封裝檔。
+
+    PDF 以每批 RENDER_BATCH_PAGES 頁渲染，每批完成即寫入封裝檔，讓已處理的頁面可立即用於問答；
+    並於每頁之間檢查取消事件。提取完成後壓實封裝檔，移除逐批提交留下的舊索引。
 
     Args:
         file_location (str): 輸入檔案的路徑。
-        output_folder (str): 輸出文字檔案的子目錄（例如 output/<filename>）。
+        output_folder (str): 輸出封裝檔的子目錄（例如 output/<filename>）。
+        cancel_event (Optional[threading.Event]): 設定後於下一頁之前中止處理。
+        lang (str): Tesseract 語言組；預設 auto 逐頁偵測文字系統。
 
     Returns:
         List[str]: 提取的文字列表。
     """
     try:
-        dpi = 300
-        lang = "chi_tra+eng"
+        dpi = OCR_DPI
         file_path = Path(file_location)
         file_extension = file_path.suffix.lower()
         image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'}
         all_text = []
         
-        # 獲取基本文件名（不含擴展名）並創建子目錄
+        # 獲取基本文件名（不含擴展名）；子目錄與封裝檔在第一次寫入時才建立，
+        # 來源檔已被移除或工作已取消時不留下輸出
         base_filename = file_path.stem
-        output_dir = Path(output_folder)  # 僅使用 output_folder 作為根目錄，創建 <filename> 子目錄
-        output_dir.mkdir(parents=True, exist_ok=True)  # 確保子目錄存在
+        pack_path = artifact_pack_path(output_folder, base_filename)
 
         if file_extension == '.pdf':
-            images = convert_from_path(
-                file_location,
-                dpi=dpi,
-                fmt="jpeg",
-                output_folder=str(output_dir),  # 將輸出保存到 output/<filename>
-                thread_count=4
-            )
-
-            for i, img in enumerate(images):
-                text = pytesseract.image_to_string(img, lang=lang, config="--psm 6 --oem 3")
-                all_text.append(text)
-
-                page_output = output_dir / f"{base_filename}_page_{i + 1}.txt"  # 修改為直接在 <filename> 下儲存
-                with page_output.open("w", encoding="utf-8") as file_handle:
-                    file_handle.write(text)
-                    print(f"Page {i + 1} OCR 完成，保存至 {page_output}")
+            page_count = read_page_count(file_location)
+            if page_count == 0:
+                raise ValueError("PDF 沒有任何頁面")
+            if cancel_event is not None and cancel_event.is_set():
+                raise OcrCancelledError(file_location)
+            # 清除先前提取的頁面，避免新舊內容混用
+            write_artifacts(pack_path, meta={"page_count": page_count, "text_complete": False}, drop_kinds=(KIND_TEXT,))
+            # 中間渲染檔寫入暫存目錄，處理完即刪除，不留在 output/<filename>
+            with tempfile.TemporaryDirectory() as render_dir:
+                for first_page in range(1, page_count + 1, RENDER_BATCH_PAGES):
+                    last_page = min(first_page + RENDER_BATCH_PAGES - 1, page_count)
+                    images = convert_from_path(
+                        file_location,
+                        dpi=dpi,
+                        fmt="jpeg",
+                        output_folder=render_dir,
+                        first_page=first_page,
+                        last_page=last_page,
+                        thread_count=OCR_THREADS
+                    )
+
+                    # 每批提交一次，避免逐頁追加完整索引；取消或失敗時仍保留本批已完成的頁面
+                    batch_texts: Dict[int, str] = {}
+                    try:
+                        for i, img in enumerate(images, start=first_page):
+                            if cancel_event is not None and cancel_event.is_set():
+                                raise OcrCancelledError(file_location)
+                            text = ocr_page(img, lang, dpi)
+                            all_text.append(text)
+                            batch_texts[i] = text
+                            page_logger.info("頁面 OCR 完成", extra={"page": i, "page_count": page_count, "lang": lang})
+                    finally:
+                        if batch_texts:
+                            write_artifacts(pack_path, texts=batch_texts, create=False)
+
+                    # 釋放本批影像與暫存檔
+                    del images
+                    for render_file in Path(render_dir).iterdir():
+                        render_file.unlink()
 
         elif file_extension in image_extensions:
             img = Image.open(file_location)
-            img_np = np.array(img)
-            text = pytesseract.image_to_string(img_np, lang=lang, config="--psm 6 --oem 3")
+            img.load()
+            # 圖片解析度未知，以 OCR_DPI 視之
+            text = ocr_page(img, lang, dpi)
             all_text.append(text)
+            write_artifacts(pack_path, texts={1: text})
+            logger.info("圖片 OCR 完成", extra={"path": file_location})
 
-            # 為圖片文件創建相應的輸出檔案，直接在 output/<filename> 下
-            output_file = output_dir / f"{base_filename}_full_text.txt"
-            with output_file.open("w", encoding="utf-8") as file_handle:
-                file_handle.write(text)
-                print(f"圖片 OCR 完成，保存至 {output_file}")
-
-        print("Extracted text from file using OCR.")
+        write_artifacts(
+            pack_path,
+            meta={"page_count": len(all_text), "text_complete": True, "content_hash": content_hash(all_text)},
+            create=False,
+        )
+        # 清除逐批提交留下的舊索引與重新提取前的舊文字
+        compact_artifact_pack(pack_path)
+        logger.info("OCR 文字提取完成", extra={"path": str(pack_path), "page_count": len(all_text)})
         return all_text
 
+    except OcrCancelledError:
+        logger.info(f"檔案 {file_location} 的 OCR 已取消")
+        raise
     except Exception as error:
-        logging.error(f"處理檔案 {file_location} 時失敗：{str(error)}", exc_info=True)
+        logger.error(f"處理檔案 {file_location} 時失敗：{str(error)}", exc_info=True)
         return f"錯誤: {error}"
 
-    except Exception as error:
-        logging.error(f"處理檔案 {file_location} 時失敗：{str(error)}", exc_info=True)
-        return f"錯誤: {error}"
+def is_text_extracted(filename: str, output_folder: str) -> bool:
+    """
+    檢查檔案是否已完成文字提取（封裝檔或 Docling 的完整文字檔）。
+
+    Args:
+        filename (str): 檔案名稱。
+        output_folder (str): 輸出子目錄（例如 output/<filename>）。
+
+    Returns:
+        bool: 是否已完成文字提取。
+    """
+    base_filename = Path(filename).stem
+    if (Path(output_folder) / f"{base_filename}_full_text.txt").exists():
+        return True
+    pack = open_artifact_pack(artifact_pack_path(output_folder, base_filename))
+    return pack is not None and pack.read_meta().get("text_complete", False)
+
+# 縮圖渲染參數：每次渲染的頁數上限，首批只渲染一頁以盡快顯示
+THUMBNAIL_DPI = 150
+THUMBNAIL_MAX_BATCH_PAGES = 16
+
+def thumbnail_url(base_filename: str, page: int) -> str:
+    """回傳縮圖讀取路由的 URL。"""
+    return f"/thumbnail/{base_filename}/{page}"
+
+def get_thumbnail_progress(filename: str, output_folder: str) -> Tuple[int, Optional[int]]:
+    """
+    獲取縮圖產生進度。
+
+    Args:
+        filename (str): 檔案名稱。
+        output_folder (str): 縮圖儲存子目錄（例如 output/<filename>）。
+
+    Returns:
+        Tuple[int, Optional[int]]: 從第 1 頁起連續可用的縮圖數，以及文件總頁數（未知時為 None）。
+    """
+    pack = open_artifact_pack(artifact_pack_path(output_folder, Path(filename).stem))
+    if pack is None:
+        return 0, None
+    return pack.contiguous_pages(KIND_THUMBNAIL), pack.read_meta().get("page_count")
+
+def get_text_progress(filename: str, output_folder: str) -> Tuple[int, Optional[int]]:
+    """
+    獲取文字提取進度。
+
+    Args:
+        filename (str): 檔案名稱。
+        output_folder (str): 輸出子目錄（例如 output/<filename>）。
+
+    Returns:
+        Tuple[int, Optional[int]]: 從第 1 頁起連續已提取的頁數，以及文件總頁數（未知時為 None）。
+    """
+    pack = open_artifact_pack(artifact_pack_path(output_folder, Path(filename).stem))
+    if pack is None:
+        return 0, None
+    return pack.contiguous_pages(KIND_TEXT), pack.read_meta().get("page_count")
 
 def get_existing_thumbnails(filename: str, output_folder: str) -> List[str]:
     """
-    獲取指定檔案的現有縮圖路徑。
+    獲取指定檔案的現有縮圖路徑；縮圖尚未全部產生時返回空列表。
 
     Args:
         filename (str): 檔案名稱。
@@ -98,49 +367,75 @@ def get_existing_thumbnails(filename: str, output_folder: str) -> List[str]:
     Returns:
         List[str]: 現有縮圖的路徑列表。
     """
-    output_dir = Path(output_folder)
     base_filename = Path(filename).stem
-    existing_paths = []
-    page_num = 1
-    while True:
-        output_path = output_dir / f"{base_filename}_page_{page_num}.png"
-        if output_path.exists():
-            # 更新路徑以反映子目錄結構
-            existing_paths.append(f"/output/{base_filename}/{base_filename}_page_{page_num}.png")
-            page_num += 1
-        else:
-            break
-    return existing_paths
-
-def generate_pdf_thumbnails(file_path: str, output_folder: str, dpi: int = 300) -> List[str]:
+    available, page_count = get_thumbnail_progress(filename, output_folder)
+    if page_count is None or available < page_count:
+        return []
+    return [thumbnail_url(base_filename, page) for page in range(1, available + 1)]
+
+def generate_pdf_thumbnails(
+    file_path: str,
+    output_folder: str,
+    dpi: int = THUMBNAIL_DPI,
+    cancel_event: Optional[threading.Event] = None,
+) -> List[str]:
     """
-    將 PDF 文件每頁製作成縮圖。
+    將 PDF 文件每頁製作成縮圖並逐批寫入產物封裝檔。
+
+    批次大小由 1 頁起倍增至 THUMBNAIL_MAX_BATCH_PAGES，讓前幾頁能立即顯示；
+    已存在於封裝檔中的連續頁面會被略過，可接續中斷的渲染。
 
     Args:
         file_path (str): PDF 檔案路徑。
-        output_folder (str): 縮圖儲存子目錄（例如 output/<filename>）。
-        dpi (int): 縮圖品質，預設為 300。
+        output_folder (str): 封裝檔儲存子目錄（例如 output/<filename>）。
+        dpi (int): 縮圖品質，預設為 THUMBNAIL_DPI。
+        cancel_event (Optional[threading.Event]): 設定後於下一批之前停止渲染。
 
     Returns:
-        List[str]: 生成的縮圖路徑列表，若失敗則返回空列表。
+        List[str]: 已生成的縮圖路徑列表（取消時僅含已完成的頁面），若失敗則返回空列表。
     """
     try:
-        images = convert_from_path(file_path)
-        output_dir = Path(output_folder)
-        output_dir.mkdir(parents=True, exist_ok=True)  # 確保子目錄存在
-        output_paths = []
         base_filename = Path(file_path).stem
-
-        for i, image in enumerate(images):
-            output_path = output_dir / f"{base_filename}_page_{i + 1}.png"
-            image.save(str(output_path), 'PNG')
-            # 更新路徑以反映子目錄結構
-            output_paths.append(f"/output/{base_filename}/{base_filename}_page_{i + 1}.png")
-
-        return output_paths
+        pack_path = artifact_pack_path(output_folder, base_filename)
+        page_count = read_page_count(file_path)
+        available, _ = get_thumbnail_progress(file_path, output_folder)
+        if cancel_event is not None and cancel_event.is_set():
+            return []
+        write_artifacts(pack_path, meta={"page_count": page_count})
+
+        first_page = available + 1
+        batch_pages = 1
+        with tempfile.TemporaryDirectory() as render_dir:
+            while first_page <= page_count:
+                if cancel_event is not None and cancel_event.is_set():
+                    logger.info("縮圖渲染已取消", extra={"path": file_path, "rendered_pages": first_page - 1})
+                    return [thumbnail_url(base_filename, page) for page in range(1, first_page)]
+                last_page = min(first_page + batch_pages - 1, page_count)
+                images = convert_from_path(
+                    file_path,
+                    dpi=dpi,
+                    output_folder=render_dir,
+                    first_page=first_page,
+                    last_page=last_page,
+                )
+                thumbnails = {}
+                for page, image in enumerate(images, start=first_page):
+                    buffer = io.BytesIO()
+                    image.save(buffer, 'PNG', optimize=True)
+                    thumbnails[page] = buffer.getvalue()
+                write_artifacts(pack_path, thumbnails=thumbnails, create=False)
+
+                # 釋放本批影像與暫存檔
+                del images
+                for render_file in Path(render_dir).iterdir():
+                    render_file.unlink()
+                first_page = last_page + 1
+                batch_pages = min(batch_pages * 2, THUMBNAIL_MAX_BATCH_PAGES)
+
+        return [thumbnail_url(base_filename, page) for page in range(1, page_count + 1)]
 
     except Exception as error:
-        print(f"製作縮圖時發生錯誤：{error}")
+        logger.error(f"製作縮圖時發生錯誤：{error}")
         return []
 
 
@@ -150,6 +445,7 @@ from docling.document_converter import (
     WordFormatOption,
     InputFormat,
 )
+from docling.datamodel.base_models import ConversionStatus
 from docling.datamodel.pipeline_options import (
     EasyOcrOptions,
     PdfPipelineOptions,
@@ -161,60 +457,52 @@ from docling.datamodel.pipeline_options import (
 from docling.pipeline.standard_pdf_pipeline import StandardPdfPipeline
 from docling.backend.pypdfium2_backend import PyPdfiumDocumentBackend
 
-def docling_extract_text_from_file(file_location: str, output_folder: str) -> list[str]:
-    """
-    使用 Docling 從 PDF 或圖片文件中提取文字，始終使用 Tesseract OCR 處理無內嵌文字的 PDF 和圖片。
-    
-    Args:
-        file_location (str): 輸入檔案路徑（PDF 或圖片，如 JPG、PNG 等）。
-        output_folder (str): 輸出文字檔案的目錄。
-    
-    Returns:
-        list[str]: 提取的文字列表（每段文字為一個元素），若失敗則返回 ["錯誤: {error}"]。
+# Docling 可輸出的格式與對應的副檔名
+DOCLING_EXPORT_FORMATS = {
+    "text": "txt",
+    "markdown": "md",
+    "doctags": "doctags",
+}
+
+# 全域 Docling 轉換器池：依管道選項快取，避免每份文件重新載入版面與表格模型
+_docling_converters: Dict[Tuple, DocumentConverter] = {}
+_docling_converters_lock = threading.Lock()
+
+def get_docling_converter(
+    do_ocr: bool = True,
+    do_table_structure: bool = True,
+    ocr_lang: Tuple[str, ...] = ("chi_tra", "eng"),
+    num_threads: int = 6,
+) -> DocumentConverter:
     """
-    try:
-        input_doc_path = Path(file_location)
-        if not input_doc_path.exists():
-            raise FileNotFoundError(f"檔案不存在: {file_location}")
-
-        logging.info(f"開始處理檔案: {input_doc_path.absolute()}")
-
-        # 配置 PDF 處理管道
-        pdf_pipeline_options = PdfPipelineOptions()
-        pdf_pipeline_options.do_table_structure = True
-        pdf_pipeline_options.table_structure_options.do_cell_matching = True
-        pdf_pipeline_options.accelerator_options = AcceleratorOptions(
-            num_threads=6,
-            device=AcceleratorDevice.AUTO
-        )
+    取得（必要時建立）指定管道選項的共用 Docling 轉換器。
 
-        # 始終啟用 Tesseract OCR 處理圖片和無內嵌文字 PDF
-        extension = input_doc_path.suffix.lower()
-        image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'}
+    首次建立時即初始化 PDF 管道，讓模型載入只發生一次；之後相同選項的呼叫直接重用。
 
-        if extension in image_extensions:
-            # 處理圖片文件，使用 Tesseract OCR
-            img = Image.open(file_location)
-            text = pytesseract.image_to_string(img, lang="chi_tra+eng", config="--psm 6 --oem 3")
-            all_text = [text.strip()] if text.strip() else []
-
-            # 創建輸出目錄並保存結果
-            output_dir = Path(output_folder)
-            output_dir.mkdir(parents=True, exist_ok=True)
-            base_filename = input_doc_path.stem
-
-            # 僅保存 TXT 文件（圖片無 MD 或 doctags）
-            full_text_path = output_dir / f"{base_filename}_full_text.txt"
-            with full_text_path.open("w", encoding="utf-8") as file_handle:
-                file_handle.write(text.strip() if text.strip() else "無可識別文字")
-
-            return all_text
+    Args:
+        do_ocr (bool): 是否啟用 Tesseract OCR。
+        do_table_structure (bool): 是否啟用表格結構辨識。
+        ocr_lang (Tuple[str, ...]): Tesseract 語言包。
+        num_threads (int): 加速器使用的執行緒數。
 
-        elif extension == ".pdf":
-            # 對於 PDF，始終啟用 Tesseract OCR
-            pdf_pipeline_options.do_ocr = True
-            pdf_pipeline_options.ocr_options = TesseractCliOcrOptions(
-                lang=["chi_tra", "eng"])
+    Returns:
+        DocumentConverter: 已初始化的轉換器。
+    """
+    key = (do_ocr, do_table_structure, tuple(ocr_lang), num_threads)
+    with _docling_converters_lock:
+        doc_converter = _docling_converters.get(key)
+        if doc_converter is None:
+            # 配置 PDF 處理管道
+            pdf_pipeline_options = PdfPipelineOptions()
+            pdf_pipeline_options.do_table_structure = do_table_structure
+            pdf_pipeline_options.table_structure_options.do_cell_matching = True
+            pdf_pipeline_options.accelerator_options = AcceleratorOptions(
+                num_threads=num_threads,
+                device=AcceleratorDevice.AUTO
+            )
+            pdf_pipeline_options.do_ocr = do_ocr
+            if do_ocr:
+                pdf_pipeline_options.ocr_options = TesseractCliOcrOptions(lang=list(ocr_lang))
 
             # 配置格式選項，使用 PyPdfium 後端
             format_options = {
@@ -224,53 +512,151 @@ def docling_extract_text_from_file(file_location: str, output_folder: str) -> li
                     backend=PyPdfiumDocumentBackend
                 )
             }
-
-            # 初始化並執行轉換
             doc_converter = DocumentConverter(format_options=format_options)
-            conv_result = doc_converter.convert(input_doc_path)
-
-            # 獲取提取的文字
-            document = conv_result.document
-            all_text = document.export_to_text().split("\n")
-            # 過濾空字符串
-            all_text = [text for text in all_text if text.strip()]
-
-            # 創建輸出目錄並保存結果
-            output_dir = Path(output_folder)
-            output_dir.mkdir(parents=True, exist_ok=True)
-            base_filename = input_doc_path.stem
-
-            # 保存完整文字內容（TXT 格式）
-            full_text_path = output_dir / f"{base_filename}_full_text.txt"
-            with full_text_path.open("w", encoding="utf-8") as file_handle:
-                file_handle.write(document.export_to_text())
-
-            # 保存完整文字內容（Markdown 格式）
-            full_text_md_path = output_dir / f"{base_filename}_full_text.md"
-            with full_text_md_path.open("w", encoding="utf-8") as file_handle:
-                file_handle.write(document.export_to_markdown())
-
-            # 保存文檔標記
-            doctags_path = output_dir / f"{base_filename}_full_text.doctags"
-            with doctags_path.open("w", encoding="utf-8") as file_handle:
-                file_handle.write(document.export_to_document_tokens())
-
-            # 保存表格數據（若存在）
-            tables = document.tables
-            if tables:
-                table_data = []
-                for table in tables:
-                    table_dict = {"rows": table.rows}
-                    table_data.append(table_dict)
-                table_json_path = output_dir / f"{base_filename}_tables.json"
-                with table_json_path.open("w", encoding="utf-8") as f:
-                    json.dump(table_data, f)
-
-            return all_text
-
-        else:
-            raise ValueError(f"不支援的文件類型: {input_doc_path.suffix}")
+            doc_converter.initialize_pipeline(InputFormat.PDF)
+            _docling_converters[key] = doc_converter
+            logger.info(f"已建立 Docling 轉換器: {key}")
+    return doc_converter
+
+def _save_docling_document(document, output_folder: str, base_filename: str, formats: Iterable[str]) -> List[str]:
+    """
+    一次匯出所需格式並保存，回傳過濾空行後的文字列表。
+
+    每種格式只序列化一次，純文字同時用於回傳值與 TXT 檔案。
+    """
+    output_dir = Path(output_folder)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    exported = {"text": document.export_to_text()}
+    if "markdown" in formats:
+        exported["markdown"] = document.export_to_markdown()
+    if "doctags" in formats:
+        exported["doctags"] = document.export_to_document_tokens()
+
+    for export_format, content in exported.items():
+        if export_format != "text" or "text" in formats:
+            export_path = output_dir / f"{base_filename}_full_text.{DOCLING_EXPORT_FORMATS[export_format]}"
+            with export_path.open("w", encoding="utf-8") as file_handle:
+                file_handle.write(content)
+
+    # 保存表格數據（若存在）
+    tables = document.tables
+    if tables:
+        table_data = []
+        for table in tables:
+            table_dict = {"rows": table.rows}
+            table_data.append(table_dict)
+        table_json_path = output_dir / f"{base_filename}_tables.json"
+        with table_json_path.open("w", encoding="utf-8") as f:
+            json.dump(table_data, f)
+
+    # 過濾空字符串
+    return [text for text in exported["text"].split("\n") if text.strip()]
+
+def _docling_extract_text_from_image(file_location: str, output_folder: str) -> List[str]:
+    """以 Tesseract OCR 處理圖片文件（圖片無 MD 或 doctags）。"""
+    img = Image.open(file_location)
+    text = pytesseract.image_to_string(img, lang="chi_tra+eng", config="--psm 6 --oem 3")
+    all_text = [text.strip()] if text.strip() else []
+
+    # 創建輸出目錄並保存結果
+    output_dir = Path(output_folder)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    full_text_path = output_dir / f"{Path(file_location).stem}_full_text.txt"
+    with full_text_path.open("w", encoding="utf-8") as file_handle:
+        file_handle.write(text.strip() if text.strip() else "無可識別文字")
+
+    return all_text
+
+def docling_batch_extract_text(
+    file_locations: List[str],
+    output_folders: List[str],
+    formats: Iterable[str] = tuple(DOCLING_EXPORT_FORMATS),
+) -> List[List[str]]:
+    """
+    使用同一個 Docling 轉換器批次提取多份文件的文字。
+
+    PDF 透過共用轉換器的 convert_all 依序轉換，模型只載入一次；圖片則直接使用 Tesseract OCR。
+
+    Args:
+        file_locations (List[str]): 輸入檔案路徑列表（PDF 或圖片）。
+        output_folders (List[str]): 與輸入一一對應的輸出目錄列表。
+        formats (Iterable[str]): 需保存的格式，可包含 'text'、'markdown'、'doctags'。
+
+    Returns:
+        List[List[str]]: 與輸入順序對應的文字列表，失敗者為 ["錯誤: {error}"]。
+    """
+    formats = set(formats)
+    unknown_formats = formats - set(DOCLING_EXPORT_FORMATS)
+    if unknown_formats:
+        raise ValueError(f"不支援的匯出格式: {sorted(unknown_formats)}")
+
+    image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'}
+    results: List[List[str]] = [[] for _ in file_locations]
+    pdf_indices = []
 
+    for index, (file_location, output_folder) in enumerate(zip(file_locations, output_folders)):
+        input_doc_path = Path(file_location)
+        try:
+            if not input_doc_path.exists():
+                raise FileNotFoundError(f"檔案不存在: {file_location}")
+            extension = input_doc_path.suffix.lower()
+            if extension in image_extensions:
+                results[index] = _docling_extract_text_from_image(file_location, output_folder)
+            elif extension == ".pdf":
+                pdf_indices.append(index)
+            else:
+                raise ValueError(f"不支援的文件類型: {input_doc_path.suffix}")
+        except Exception as error:
+            logger.error(f"處理檔案 {file_location} 時失敗：{str(error)}", exc_info=True)
+            results[index] = ["錯誤: " + str(error)]
+
+    if not pdf_indices:
+        return results
+
+    # 對於 PDF，始終啟用 Tesseract OCR
+    doc_converter = get_docling_converter()
+    input_paths = [Path(file_locations[index]) for index in pdf_indices]
+    logger.info(f"開始批次處理 {len(input_paths)} 份 PDF")
+    conv_results = doc_converter.convert_all(input_paths, raises_on_error=False)
+
+    for index, conv_result in zip(pdf_indices, conv_results):
+        file_location = file_locations[index]
+        try:
+            if conv_result.status not in (ConversionStatus.SUCCESS, ConversionStatus.PARTIAL_SUCCESS):
+                errors = "; ".join(error.error_message for error in conv_result.errors)
+                raise RuntimeError(f"Docling 轉換失敗 ({conv_result.status}): {errors}")
+            results[index] = _save_docling_document(
+                conv_result.document,
+                output_folders[index],
+                Path(file_location).stem,
+                formats,
+            )
+        except Exception as error:
+            logger.error(f"處理檔案 {file_location} 時失敗：{str(error)}", exc_info=True)
+            results[index] = ["錯誤: " + str(error)]
+
+    return results
+
+def docling_extract_text_from_file(
+    file_location: str,
+    output_folder: str,
+    formats: Iterable[str] = tuple(DOCLING_EXPORT_FORMATS),
+) -> list[str]:
+    """
+    使用 Docling 從 PDF 或圖片文件中提取文字，始終使用 Tesseract OCR 處理無內嵌文字的 PDF 和圖片。
+    
+    Args:
+        file_location (str): 輸入檔案路徑（PDF 或圖片，如 JPG、PNG 等）。
+        output_folder (str): 輸出文字檔案的目錄。
+        formats (Iterable[str]): 需保存的格式，可包含 'text'、'markdown'、'doctags'。
+    
+    Returns:
+        list[str]: 提取的文字列表（每段文字為一個元素），若失敗則返回 ["錯誤: {error}"]。
+    """
+    logger.info(f"開始處理檔案: {Path(file_location).absolute()}")
+    try:
+        return docling_batch_extract_text([file_location], [output_folder], formats)[0]
     except Exception as error:
-        logging.error(f"處理檔案 {file_location} 時失敗：{str(error)}", exc_info=True)
+        logger.error(f"處理檔案 {file_location} 時失敗：{str(error)}", exc_info=True)
         return ["錯誤: " + str(error)]
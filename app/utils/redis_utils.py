@@ -5,9 +5,13 @@ Redis 工具模組，用於管理使用者對話歷史（使用 redis-py 異步
 
 import os
 import json
+import logging
+from typing import Optional
 from redis.asyncio import Redis
 from redis.exceptions import ConnectionError
 
+logger = logging.getLogger(__name__)
+
 
 # Redis 連線配置
 REDIS_URL = os.environ.get("REDIS_URL", "redis://192.168.11.3:6379")  # 預設為指定 Redis
@@ -15,34 +19,49 @@ REDIS_URL = os.environ.get("REDIS_URL", "redis://192.168.11.3:6379")  # 預設
 # 定義過期時間（單位：秒，例如 24 小時）
 HISTORY_TTL = 604800  # 24 小時，您可以根據需求調整，例如 3600（1小時）或 604800（7天）
 
+# 對話歷史只保留最近的訊息數；較早的對話由長期記憶（memory_utils）檢索
+HISTORY_MAX_MESSAGES = 40
+
 # 全局 Redis 連接池
 redis_pool = None
+# 存取二進位資料（例如記憶向量）的連接池，不自動解碼
+redis_binary_pool = None
 
 async def init_redis_pool():
     """初始化全局 Redis 連接池"""
-    global redis_pool
+    global redis_pool, redis_binary_pool
     if redis_pool is None:
         redis_pool = await Redis.from_url(
             REDIS_URL,
             decode_responses=True,  # 自動解碼為字符串
             max_connections=10      # 設置最大連接數，可根據需求調整
         )
-    print("Redis 連接池已初始化")
+    if redis_binary_pool is None:
+        redis_binary_pool = await Redis.from_url(
+            REDIS_URL,
+            decode_responses=False,
+            max_connections=10
+        )
+    logger.info("Redis 連接池已初始化")
 
 async def close_redis_pool():
     """關閉全局 Redis 連接池"""
-    global redis_pool
+    global redis_pool, redis_binary_pool
     if redis_pool:
         await redis_pool.aclose()
-        print("Redis 連接池已關閉")
+        logger.info("Redis 連接池已關閉")
         redis_pool = None
+    if redis_binary_pool:
+        await redis_binary_pool.aclose()
+        redis_binary_pool = None
 
-async def get_redis_history_chat(user_id: str) -> list:
+async def get_redis_history_chat(user_id: str, limit: Optional[int] = None) -> list:
     """
     從 Redis 獲取指定使用者的對話歷史（異步版本，使用全局連接池）。
 
     Args:
         user_id (str): 使用者 ID。
+        limit (Optional[int]): 只返回最近的訊息數，None 表示全部。
 
     Returns:
         list: 對話歷史訊息列表，若無則返回空列表。
@@ -53,15 +72,18 @@ async def get_redis_history_chat(user_id: str) -> list:
             await init_redis_pool()
         messages = await redis_pool.get(messages_key)
         if messages:
-            return json.loads(messages)
+            messages = json.loads(messages)
+            return messages[-limit:] if limit else messages
         return []
     except Exception as e:
-        logging.error(f"無法獲取 Redis 歷史: {e}")
+        logger.error(f"無法獲取 Redis 歷史: {e}")
         return []
 
 async def update_redis_history_chat(user_id: str, question: str, response: str) -> None:
     """
     更新 Redis 中指定使用者的對話歷史，並設置過期時間（異步版本，使用全局連接池）。
+    僅保留最近 HISTORY_MAX_MESSAGES 則訊息；較早的問答由長期記憶保存，
+    呼叫端需先以 memory_utils.remember_turn 寫入，使舊歷史在裁剪前匯入記憶。
 
     Args:
         user_id (str): 使用者 ID。
@@ -73,21 +95,24 @@ async def update_redis_history_chat(user_id: str, question: str, response: str)
         messages = await get_redis_history_chat(user_id)
         messages.append({"role": "user", "content": question})
         messages.append({"role": "assistant", "content": response})
+        messages = messages[-HISTORY_MAX_MESSAGES:]
         await redis_pool.set(messages_key, json.dumps(messages))
         await redis_pool.expire(messages_key, HISTORY_TTL)
     except Exception as e:
-        print(f"無法更新 Redis 歷史: {e}")
+        logger.error(f"無法更新 Redis 歷史: {e}")
 
 # 測試 Redis 連線（異步版本）
 async def test_redis_connection():
     try:
         await redis_pool.ping()
-        print("成功連線到 Redis 伺服器（異步，全局連接池）")
+        logger.info("成功連線到 Redis 伺服器（異步，全局連接池）")
     except ConnectionError as e:
-        print(f"無法連線到 Redis 伺服器: {e}")
+        logger.error(f"無法連線到 Redis 伺服器: {e}")
 
 if __name__ == "__main__":
     import asyncio
+    from utils.logging_utils import setup_logging
+    setup_logging()
     loop = asyncio.get_event_loop()
     if loop.is_closed():
         loop = asyncio.new_event_loop()
@@ -0,0 +1,204 @@
+# utils/singleflight.py
+"""
+Single-flight 工具模組：相同 key 的並行呼叫只執行一次計算，並共享其結果。
+
+同一程序內以共享的 asyncio.Task 合併呼叫；跨 worker 時以 Redis 鎖選出唯一執行者，
+其他 worker 輪詢 Redis 取得執行者寫入的結果。
+"""
+
+import json
+import uuid
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from redis.exceptions import ResponseError
+
+from utils import redis_utils
+
+logger = logging.getLogger(__name__)
+
+# Redis 鍵前綴
+LOCK_PREFIX = "singleflight:lock:"
+RESULT_PREFIX = "singleflight:result:"
+
+# 預設鎖存活時間（執行期間會定期延長）與結果保留時間（秒）
+DEFAULT_LOCK_TTL = 30
+DEFAULT_RESULT_TTL = 30
+# 等待其他 worker 結果時的輪詢間隔（秒）
+POLL_INTERVAL = 0.2
+
+# 僅在鎖仍屬於自己時刪除
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+# Redis 不支援 Lua 腳本時（例如未安裝 lupa 的 fakeredis，或帳號無 EVAL 權限）改為 GET/DEL 釋放鎖
+_scripting_supported = True
+
+async def _release_lock(redis, lock_key: str, token: str) -> None:
+    """僅在鎖仍屬於自己時刪除；不支援 EVAL 時退回非原子的 GET/DEL，並記住結果不再嘗試。"""
+    global _scripting_supported
+    if _scripting_supported:
+        try:
+            await redis.eval(_RELEASE_SCRIPT, 1, lock_key, token)
+            return
+        except (ResponseError, ImportError) as e:
+            _scripting_supported = False
+            logger.warning("Redis 不支援 Lua 腳本，Single-flight 改以 GET/DEL 釋放鎖", extra={"error": str(e)})
+    if await redis.get(lock_key) == token:
+        await redis.delete(lock_key)
+
+class SingleFlightError(Exception):
+    """其他 worker 執行同一計算時失敗。"""
+
+class SingleFlight:
+    """合併相同 key 的並行計算。"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+
+    def in_flight(self, key: str) -> bool:
+        """回傳此程序中是否有相同 key 的計算正在進行。"""
+        return key in self._calls
+
+    async def wait(self, key: str) -> None:
+        """等待此程序中相同 key 進行中的計算結束；忽略其結果與例外。"""
+        task = self._calls.get(key)
+        if task is not None:
+            await asyncio.wait({task})
+
+    async def do(
+        self,
+        key: str,
+        func: Callable[[], Awaitable[Any]],
+        distributed: bool = False,
+        lock_ttl: int = DEFAULT_LOCK_TTL,
+        result_ttl: int = DEFAULT_RESULT_TTL,
+    ) -> Any:
+        """
+        執行 func 或等待相同 key 進行中的計算，並返回其結果。
+
+        計算於獨立 Task 中執行，個別呼叫者被取消不會中斷其他等待者。
+
+        Args:
+            key (str): 計算識別。
+            func (Callable[[], Awaitable[Any]]): 產生結果的協程函式。
+            distributed (bool): 是否透過 Redis 鎖跨 worker 合併；結果需可 JSON 序列化。
+            lock_ttl (int): Redis 鎖存活時間（秒），執行期間每 1/3 週期延長一次。
+            result_ttl (int): 結果在 Redis 中保留的秒數，供等待中的 worker 讀取。
+
+        Returns:
+            Any: 計算結果。
+        """
+        task = self._calls.get(key)
+        if task is None:
+            coroutine = self._do_distributed(key, func, lock_ttl, result_ttl) if distributed else func()
+            task = asyncio.ensure_future(coroutine)
+            self._calls[key] = task
+
+            def on_done(done_task: asyncio.Task) -> None:
+                if self._calls.get(key) is done_task:
+                    del self._calls[key]
+                if not done_task.cancelled():
+                    done_task.exception()  # 標記例外已取得，避免無人等待時的警告
+
+            task.add_done_callback(on_done)
+        return await asyncio.shield(task)
+
+    async def _do_distributed(
+        self,
+        key: str,
+        func: Callable[[], Awaitable[Any]],
+        lock_ttl: int,
+        result_ttl: int,
+    ) -> Any:
+        redis = redis_utils.redis_pool
+        if redis is None:
+            return await func()
+
+        lock_key = LOCK_PREFIX + key
+        token = uuid.uuid4().hex
+        try:
+            acquired = await redis.set(lock_key, token, nx=True, ex=lock_ttl)
+        except Exception as e:
+            logger.warning("Single-flight 無法取得 Redis 鎖，改為本地執行", extra={"key": key, "error": str(e)})
+            return await func()
+
+        if acquired:
+            return await self._lead(redis, lock_key, token, func, lock_ttl, result_ttl)
+
+        while True:
+            try:
+                leader_token = await redis.get(lock_key)
+                if leader_token is None:
+                    # 鎖已釋放或過期，嘗試成為執行者
+                    if await redis.set(lock_key, token, nx=True, ex=lock_ttl):
+                        return await self._lead(redis, lock_key, token, func, lock_ttl, result_ttl)
+                    continue
+                payload = await self._wait_result(redis, lock_key, leader_token)
+            except SingleFlightError:
+                raise
+            except Exception as e:
+                logger.warning("Single-flight 等待 Redis 結果失敗，改為本地執行", extra={"key": key, "error": str(e)})
+                return await func()
+            if payload is not None:
+                if payload["ok"]:
+                    return payload["value"]
+                raise SingleFlightError(payload["error"])
+
+    async def _wait_result(self, redis, lock_key: str, leader_token: str) -> Optional[dict]:
+        """輪詢執行者的結果；執行者未寫入結果即釋放鎖時返回 None。"""
+        result_key = RESULT_PREFIX + leader_token
+        while True:
+            result = await redis.get(result_key)
+            if result is not None:
+                return json.loads(result)
+            if await redis.get(lock_key) != leader_token:
+                result = await redis.get(result_key)
+                return json.loads(result) if result is not None else None
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def _lead(
+        self,
+        redis,
+        lock_key: str,
+        token: str,
+        func: Callable[[], Awaitable[Any]],
+        lock_ttl: int,
+        result_ttl: int,
+    ) -> Any:
+        """以執行者身分計算結果，寫入 Redis 後釋放鎖。"""
+        async def keep_alive() -> None:
+            while True:
+                await asyncio.sleep(lock_ttl / 3)
+                try:
+                    await redis.expire(lock_key, lock_ttl)
+                except Exception as e:
+                    logger.warning("Single-flight 延長 Redis 鎖失敗", extra={"lock_key": lock_key, "error": str(e)})
+
+        heartbeat = asyncio.create_task(keep_alive())
+        result_key = RESULT_PREFIX + token
+
+        async def publish(payload: dict) -> None:
+            try:
+                await redis.set(result_key, json.dumps(payload), ex=result_ttl)
+            except Exception as e:
+                logger.warning("Single-flight 寫入 Redis 結果失敗", extra={"lock_key": lock_key, "error": str(e)})
+
+        try:
+            try:
+                value = await func()
+            except Exception as error:
+                await publish({"ok": False, "error": str(error)})
+                raise
+            await publish({"ok": True, "value": value})
+            return value
+        finally:
+            heartbeat.cancel()
+            try:
+                await _release_lock(redis, lock_key, token)
+            except Exception as e:
+                logger.warning("Single-flight 釋放 Redis 鎖失敗", extra={"lock_key": lock_key, "error": str(e)})
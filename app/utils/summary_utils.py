@@ -0,0 +1,264 @@
+# utils/summary_utils.py
+"""
+文件摘要工具模組，於文字提取後以 map-reduce 方式預先產生章節與整份文件摘要。
+"""
+
+import re
+import asyncio
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from utils.artifact_store import KIND_TEXT, artifact_pack_path, content_hash, open_artifact_pack, write_artifacts
+from utils.llm_utils import LLM, STR_PARSER
+
+logger = logging.getLogger(__name__)
+
+# 每個章節的字數上限（連續頁面合併至此長度後產生一份章節摘要）
+SECTION_CHAR_LIMIT = 6000
+# 化簡階段每次合併的摘要數
+REDUCE_GROUP_SIZE = 10
+# 同時進行的摘要請求數
+SUMMARY_CONCURRENCY = 4
+# 作為問答上下文時的字數上限
+CONTEXT_CHAR_LIMIT = 12000
+
+# 判斷是否為「這份文件在講什麼」類型問題的關鍵字
+OVERVIEW_KEYWORDS = (
+    "摘要", "總結", "概要", "大意", "關於什麼", "在講什麼", "在說什麼", "內容是什麼", "主要內容",
+    "summary", "summarize", "overview", "what is this", "what's this", "what is it about",
+)
+
+SECTION_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "你是一位文件摘要助手。請以條列重點摘要以下文件片段，保留關鍵數字、名稱與表格結論，使用文件原本的語言，預設使用中文。"),
+    ("human", "文件第 {start_page}–{end_page} 頁內容：\n\n{text}"),
+])
+
+REDUCE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "你是一位文件摘要助手。請將以下各段摘要整合為一份連貫的文件摘要，先以一句話說明文件主題，再列出主要重點。"),
+    ("human", "{text}"),
+])
+
+SECTION_CHAIN = SECTION_PROMPT | LLM | STR_PARSER
+REDUCE_CHAIN = REDUCE_PROMPT | LLM | STR_PARSER
+
+# 進行中的摘要任務：封裝檔路徑 -> Task
+_summary_tasks: Dict[str, asyncio.Task] = {}
+
+def split_sections(texts: List[str]) -> List[dict]:
+    """
+    將連續頁面合併為不超過 SECTION_CHAR_LIMIT 字的章節。
+
+    Args:
+        texts (List[str]): 依頁序排列的頁面文字。
+
+    Returns:
+        List[dict]: 章節列表，包含 start_page、end_page 與 text。
+    """
+    sections = []
+    current: List[str] = []
+    start_page = 1
+    for page, text in enumerate(texts, start=1):
+        if current and sum(len(t) for t in current) + len(text) > SECTION_CHAR_LIMIT:
+            sections.append({"start_page": start_page, "end_page": page - 1, "text": "\n".join(current)})
+            current = []
+            start_page = page
+        current.append(text[:SECTION_CHAR_LIMIT])
+    if current:
+        sections.append({"start_page": start_page, "end_page": len(texts), "text": "\n".join(current)})
+    return sections
+
+def read_page_texts(output_folder: str, base_filename: str) -> List[str]:
+    """從封裝檔讀取從第 1 頁起連續的頁面文字。"""
+    pack = open_artifact_pack(artifact_pack_path(output_folder, base_filename))
+    if pack is None:
+        return []
+    return [pack.read_text(page) for page in range(1, pack.contiguous_pages(KIND_TEXT) + 1)]
+
+def get_cached_summary(output_folder: str, base_filename: str) -> Optional[dict]:
+    """
+    讀取快取的文件摘要；若頁面文字已變更則視為過期。
+
+    比對的是文字提取完成時寫入中繼資料的 content_hash，不需重新讀取與雜湊所有頁面；
+    舊版封裝檔缺少此欄位時計算一次並補寫。
+
+    Args:
+        output_folder (str): 文件輸出子目錄（例如 output/<filename>）。
+        base_filename (str): 檔案名稱（不含副檔名）。
+
+    Returns:
+        Optional[dict]: 摘要（document_summary 與 sections），若不存在或過期則返回 None。
+    """
+    pack = open_artifact_pack(artifact_pack_path(output_folder, base_filename))
+    if pack is None:
+        return None
+    summary = pack.read_summary()
+    if summary is None:
+        return None
+    meta = pack.read_meta()
+    expected_hash = meta.get("content_hash")
+    if expected_hash is None:
+        if not meta.get("text_complete"):
+            return None
+        expected_hash = content_hash(read_page_texts(output_folder, base_filename))
+        write_artifacts(artifact_pack_path(output_folder, base_filename), meta={"content_hash": expected_hash})
+    if summary.get("content_hash") != expected_hash:
+        return None
+    return summary
+
+async def _reduce_summaries(summaries: List[str], semaphore: asyncio.Semaphore) -> str:
+    """遞迴化簡摘要列表，直到只剩一份文件摘要。"""
+    async def reduce_group(group: List[str]) -> str:
+        async with semaphore:
+            return await REDUCE_CHAIN.ainvoke({"text": "\n\n---\n\n".join(group)})
+
+    while len(summaries) > 1:
+        groups = [summaries[i:i + REDUCE_GROUP_SIZE] for i in range(0, len(summaries), REDUCE_GROUP_SIZE)]
+        summaries = await asyncio.gather(*(reduce_group(group) for group in groups))
+    return summaries[0] if summaries else ""
+
+async def summarize_document(output_folder: str, base_filename: str) -> Optional[dict]:
+    """
+    以 map-reduce 產生文件摘要並寫入封裝檔；若快取仍有效則直接返回。
+
+    Args:
+        output_folder (str): 文件輸出子目錄（例如 output/<filename>）。
+        base_filename (str): 檔案名稱（不含副檔名）。
+
+    Returns:
+        Optional[dict]: 摘要，若無可摘要的文字則返回 None。
+    """
+    cached = get_cached_summary(output_folder, base_filename)
+    if cached is not None:
+        return cached
+
+    texts = read_page_texts(output_folder, base_filename)
+    if not any(text.strip() for text in texts):
+        return None
+
+    semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+
+    async def summarize_section(section: dict) -> str:
+        async with semaphore:
+            return await SECTION_CHAIN.ainvoke(section)
+
+    logger.info("開始產生文件摘要", extra={"document": base_filename, "page_count": len(texts)})
+    sections = split_sections(texts)
+    section_summaries = await asyncio.gather(*(summarize_section(section) for section in sections))
+    document_summary = await _reduce_summaries(list(section_summaries), semaphore)
+
+    summary = {
+        "content_hash": content_hash(texts),
+        "page_count": len(texts),
+        "document_summary": document_summary,
+        "sections": [
+            {"start_page": section["start_page"], "end_page": section["end_page"], "summary": section_summary}
+            for section, section_summary in zip(sections, section_summaries)
+        ],
+    }
+    await asyncio.to_thread(write_artifacts, artifact_pack_path(output_folder, base_filename), summary=summary)
+    logger.info("文件摘要完成", extra={"document": base_filename, "sections": len(sections)})
+    return summary
+
+def schedule_document_summary(output_folder: str, base_filename: str) -> asyncio.Task:
+    """在背景產生文件摘要；同一文件已有進行中的任務時直接返回該任務。"""
+    key = str(artifact_pack_path(output_folder, base_filename))
+    task = _summary_tasks.get(key)
+    if task is None or task.done():
+        task = asyncio.create_task(summarize_document(output_folder, base_filename))
+        _summary_tasks[key] = task
+
+        def on_done(done_task: asyncio.Task) -> None:
+            if _summary_tasks.get(key) is done_task:
+                del _summary_tasks[key]
+            if not done_task.cancelled() and done_task.exception() is not None:
+                logger.error("文件摘要失敗", extra={"document": base_filename, "error": str(done_task.exception())})
+
+        task.add_done_callback(on_done)
+    return task
+
+def is_overview_question(question: str) -> bool:
+    """判斷問題是否在詢問文件整體內容。"""
+    lowered = question.lower()
+    return len(question) <= 40 and any(keyword in lowered for keyword in OVERVIEW_KEYWORDS)
+
+def query_terms(text: str) -> Set[str]:
+    """將文字切分為檢索詞：英數字詞（小寫）與中文雙字詞。"""
+    terms = {word.lower() for word in re.findall(r"[A-Za-z0-9]{2,}", text)}
+    for run in re.findall(r"[\u4e00-\u9fff]+", text):
+        if len(run) == 1:
+            terms.add(run)
+        terms.update(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+def select_relevant_pages(texts: List[str], question: str, char_limit: int = CONTEXT_CHAR_LIMIT) -> List[int]:
+    """
+    依問題檢索詞出現次數挑選最相關的頁面，總字數不超過 char_limit。
+
+    Args:
+        texts (List[str]): 依頁序排列的頁面文字。
+        question (str): 使用者問題。
+        char_limit (int): 字數上限。
+
+    Returns:
+        List[int]: 選中的頁碼（從 1 開始，遞增排序）。
+    """
+    if sum(len(text) for text in texts) <= char_limit:
+        return list(range(1, len(texts) + 1))
+    terms = query_terms(question)
+    scores = [sum(text.lower().count(term) for term in terms) for text in texts]
+    ranked = sorted(range(len(texts)), key=lambda i: (-scores[i], i))
+    selected, used = [], 0
+    for i in ranked:
+        if used + len(texts[i]) > char_limit:
+            continue
+        selected.append(i + 1)
+        used += len(texts[i])
+    return sorted(selected)
+
+def coverage_note(pages_done: int, page_count: Optional[int]) -> Optional[str]:
+    """文件尚未處理完成時，回傳說明回答所依據頁面範圍的附註。"""
+    if not page_count or pages_done >= page_count:
+        return None
+    if pages_done == 0:
+        return f"（文件共 {page_count} 頁，尚未完成任何頁面的文字提取，此回答未參考文件內容）"
+    return f"（根據已處理的第 1–{pages_done} 頁回答，共 {page_count} 頁）"
+
+def build_document_context(output_folder: str, base_filename: str, question: str) -> Tuple[str, Optional[str]]:
+    """
+    建立文件問答的上下文。
+
+    有摘要時使用文件與章節摘要；否則從已提取的頁面中檢索與問題最相關者。
+    文件仍在處理中時，只使用目前已完成的頁面，並附上涵蓋範圍說明。
+
+    Args:
+        output_folder (str): 文件輸出子目錄（例如 output/<filename>）。
+        base_filename (str): 檔案名稱（不含副檔名）。
+        question (str): 使用者問題。
+
+    Returns:
+        Tuple[str, Optional[str]]: 上下文文字（不超過 CONTEXT_CHAR_LIMIT 字，尚無已提取頁面時為空字串），
+            以及涵蓋範圍附註（處理完成時為 None）。
+    """
+    summary = get_cached_summary(output_folder, base_filename)
+    if summary is not None:
+        parts = [f"文件摘要：\n{summary['document_summary']}"]
+        for section in summary["sections"]:
+            parts.append(f"第 {section['start_page']}–{section['end_page']} 頁摘要：\n{section['summary']}")
+        return "\n\n".join(parts)[:CONTEXT_CHAR_LIMIT], None
+
+    texts = read_page_texts(output_folder, base_filename)
+    pack = open_artifact_pack(artifact_pack_path(output_folder, base_filename))
+    meta = pack.read_meta() if pack is not None else {}
+    # 只有文字提取已開始但未完成時才附註；僅產生過縮圖的文件 meta 沒有 text_complete
+    page_count = meta.get("page_count") if meta.get("text_complete") is False else None
+    if not texts:
+        # 尚無已提取的頁面，不附加文件上下文
+        return "", coverage_note(0, page_count)
+    parts = [f"第 {page} 頁：\n{texts[page - 1]}" for page in select_relevant_pages(texts, question)]
+    context = "\n\n".join(parts)[:CONTEXT_CHAR_LIMIT]
+    note = coverage_note(len(texts), page_count)
+    if note:
+        context = f"文件共 {page_count} 頁，目前僅完成前 {len(texts)} 頁的文字提取。\n\n{context}"
+    return context, note